@@ -0,0 +1,116 @@
+import copy
+
+import numpy as np
+import pandas as pd
+
+# Grid cell sizes in degrees, from coarse to fine
+LEVELS = (2.0, 1.0, 0.5, 0.25, 0.1, 0.05, 0.02)
+
+
+def energy(mag):
+    # Radiated energy in joules (Gutenberg-Richter: log10 E = 1.5 M + 4.8)
+    return np.nan_to_num(10 ** (1.5 * mag.astype(np.float64) + 4.8))
+
+
+def _cell_codes(lat, lon, size):
+    columns = int(np.ceil(360 / size))
+    return np.floor((lat + 90) / size).astype(np.int64) * columns + np.floor((lon + 180) / size).astype(np.int64)
+
+
+def _centres(codes, size):
+    columns = int(np.ceil(360 / size))
+    return (codes // columns + 0.5) * size - 90, (codes % columns + 0.5) * size - 180
+
+
+class Pyramid:
+    # Every event's grid cell at each level is assigned once per catalog
+    # version; aggregating a filtered selection is then a bincount over the
+    # selected rows, with output bounded by the number of occupied cells.
+    def __init__(self, catalog):
+        lat = catalog.columns["LAT"].astype(np.float64)
+        lon = catalog.columns["LON"].astype(np.float64)
+        self.mag = catalog.columns["MAG"]
+        self.energy = energy(self.mag)
+
+        self.levels, self.codes = [], []
+        for size in LEVELS:
+            cells, cell_of = np.unique(_cell_codes(lat, lon, size), return_inverse=True)
+            centre_lat, centre_lon = _centres(cells, size)
+            self.levels.append((size, centre_lat, centre_lon, cell_of.astype(np.int32)))
+            self.codes.append(cells)
+
+    def extend(self, catalog, start):
+        # Pyramid of catalog, which is this pyramid's catalog with rows appended
+        # from start on: the new rows are looked up among the occupied cells and
+        # cells seen for the first time are added after the existing ones
+        lat = catalog.columns["LAT"][start:].astype(np.float64)
+        lon = catalog.columns["LON"][start:].astype(np.float64)
+        grid = copy.copy(self)
+        grid.mag = catalog.columns["MAG"]
+        grid.energy = np.concatenate([self.energy, energy(grid.mag[start:])])
+
+        grid.levels, grid.codes = [], []
+        for (size, centre_lat, centre_lon, cell_of), cells in zip(self.levels, self.codes):
+            code = _cell_codes(lat, lon, size)
+            ids = np.empty(len(code), dtype=np.int64)
+            found = np.zeros(len(code), dtype=bool)
+            if len(cells):
+                order = np.argsort(cells)
+                position = order[np.minimum(np.searchsorted(cells, code, sorter=order), len(cells) - 1)]
+                found = cells[position] == code
+                ids[found] = position[found]
+            added, added_of = np.unique(code[~found], return_inverse=True)
+            ids[~found] = len(cells) + added_of
+            added_lat, added_lon = _centres(added, size)
+            grid.levels.append((
+                size,
+                np.concatenate([centre_lat, added_lat]),
+                np.concatenate([centre_lon, added_lon]),
+                np.concatenate([cell_of, ids.astype(np.int32)]),
+            ))
+            grid.codes.append(np.concatenate([cells, added]))
+        return grid
+
+    def level_for(self, rows, max_cells, min_size=0):
+        # Finest level (no finer than min_size) whose occupied cells fit in the budget
+        for level in range(len(LEVELS) - 1, 0, -1):
+            size, _, _, cell_of = self.levels[level]
+            if size < min_size:
+                continue
+            if np.count_nonzero(np.bincount(cell_of[rows])) <= max_cells:
+                return level
+        return 0
+
+    def aggregate(self, rows, level):
+        size, centre_lat, centre_lon, cell_of = self.levels[level]
+        ids = cell_of[rows]
+        mag = np.nan_to_num(self.mag[rows].astype(np.float64))
+
+        cells = len(centre_lat)
+        count = np.bincount(ids, minlength=cells)
+        mag_sum = np.bincount(ids, weights=mag, minlength=cells)
+        energy_sum = np.bincount(ids, weights=self.energy[rows], minlength=cells)
+        mag_max = np.full(cells, -np.inf)
+        np.maximum.at(mag_max, ids, mag)
+
+        occupied = count > 0
+        return pd.DataFrame({
+            "LAT": centre_lat[occupied],
+            "LON": centre_lon[occupied],
+            "COUNT": count[occupied],
+            "MAG_SUM": mag_sum[occupied],
+            "MAG_MAX": mag_max[occupied],
+            "MAG_MEAN": mag_sum[occupied] / count[occupied],
+            "ENERGY": energy_sum[occupied],
+        })
+
+
+def pyramid(catalog):
+    return catalog.derived("pyramid", Pyramid)
+
+
+def aggregate(catalog, rows, max_cells, min_size=0):
+    # Aggregated cells for a selection at the finest level that fits max_cells
+    grid = pyramid(catalog)
+    level = grid.level_for(rows, max_cells, min_size)
+    return grid.aggregate(rows, level), LEVELS[level]
@@ -1,31 +1,137 @@
+import numpy as np
 import pandas as pd
-import plotly.express as px
 import streamlit as st
+from aggregate import LEVELS, pyramid
+from catalog import load_catalog
+from perf import span
+from persist import figure_from_json, figure_json, persistent
+from decluster import declustered
+from sidebar import selection_declustering, selection_region
+from spatial import describe, spatial_index
+from transport import floats, integers
 
-def run():
-    # Load data
-    data = pd.read_csv("dataOUT/earthquakes.csv")
-    
-    data.columns = data.columns.str.strip()
-    data['DATE'] = pd.to_datetime(data['DATE'], errors='coerce')
-    
-    data = data.dropna(subset=['DATE', 'MAG'])
-    data = data[data['MAG'] > 0]
-    
-    fig = px.scatter_mapbox(data, 
+BUCKETS = ["Year", "Quarter", "Month", "Week"]
+POINT_BUDGETS = [100, 250, 500, 1000, 2500]
+
+# Cell size used when frames are aggregated instead of decimated
+AGGREGATE_LEVEL = LEVELS.index(0.1)
+
+def bucket_codes(datetime, bucket):
+    # Integer frame code per event, the distinct codes and their labels
+    if bucket == "Year":
+        codes = datetime.astype("datetime64[Y]").astype(np.int64)
+        label = lambda code: str(1970 + code)
+    elif bucket == "Quarter":
+        codes = datetime.astype("datetime64[M]").astype(np.int64) // 3
+        label = lambda code: f"{1970 + code // 4} Q{code % 4 + 1}"
+    elif bucket == "Month":
+        codes = datetime.astype("datetime64[M]").astype(np.int64)
+        label = lambda code: str(np.datetime64(code, "M"))
+    else:
+        # Weeks starting on Monday; 1970-01-01 was a Thursday
+        codes = (datetime.astype("datetime64[D]").astype(np.int64) + 3) // 7
+        label = lambda code: f"Week of {np.datetime64(code * 7 - 3, 'D')}"
+    unique = np.unique(codes)
+    return codes, unique, np.array([label(code) for code in unique.tolist()])
+
+def decimate(codes, priority, budget):
+    # Keep at most budget items per frame, highest priority first, in the original order
+    order = np.lexsort((-priority, codes))
+    sorted_codes = codes[order]
+    rank = np.arange(len(order)) - np.searchsorted(sorted_codes, sorted_codes, side="left")
+    return np.sort(order[rank < budget])
+
+def plan_frames(catalog, rows, bucket, budget, aggregated):
+    columns = catalog.columns
+    datetime = columns["EPOCH"][rows].view("datetime64[ns]")
+    mag = columns["MAG"][rows]
+    codes, codes_unique, labels = bucket_codes(datetime, bucket)
+
+    if not aggregated:
+        keep = decimate(codes, mag, budget)
+        return pd.DataFrame({
+            "LAT": floats(columns["LAT"][rows][keep]),
+            "LON": floats(columns["LON"][rows][keep]),
+            "MAG": floats(mag[keep]),
+            "DATE": np.datetime_as_string(datetime[keep], unit="D"),
+            "FRAME": labels[np.searchsorted(codes_unique, codes[keep])],
+        })
+
+    # One point per (frame, grid cell) with the cell's event count and strongest magnitude
+    _, centre_lat, centre_lon, cell_of = pyramid(catalog).levels[AGGREGATE_LEVEL]
+    cells = cell_of[rows].astype(np.int64)
+    groups, group_of = np.unique(codes * len(centre_lat) + cells, return_inverse=True)
+    count = np.bincount(group_of)
+    mag_max = np.full(len(groups), -np.inf, dtype=np.float32)
+    np.maximum.at(mag_max, group_of, mag)
+
+    group_codes, group_cells = groups // len(centre_lat), groups % len(centre_lat)
+    keep = decimate(group_codes, mag_max, budget)
+    return pd.DataFrame({
+        "LAT": floats(centre_lat[group_cells[keep]]),
+        "LON": floats(centre_lon[group_cells[keep]]),
+        "MAG": floats(mag_max[keep]),
+        "COUNT": integers(count[keep]),
+        "FRAME": labels[np.searchsorted(codes_unique, group_codes[keep])],
+    })
+
+@st.cache_data(max_entries=16, show_spinner="Building animation...")
+@persistent("animatedMap.figure", dump=figure_json, load=figure_from_json)
+def build_figure(_catalog, digest, bucket, budget, aggregated, region, declustering):
+    import plotly.express as px
+
+    rows = _catalog.clean_rows(dropna=['DATE', 'MAG'], positive=['MAG'])
+    if region is not None:
+        rows = np.intersect1d(rows, spatial_index(_catalog).within(region), assume_unique=True)
+    if declustering is not None:
+        rows = rows[declustered(_catalog, declustering).mainshock[rows]]
+    frames = plan_frames(_catalog, rows, bucket, budget, aggregated)
+
+    fig = px.scatter_mapbox(frames, 
                          lat='LAT', 
                          lon='LON', 
                          color='MAG',  
                          size='MAG',   
-                         hover_name='DATE',  
-                         animation_frame=data['DATE'].dt.year.astype(str),
+                         hover_name=None if aggregated else 'DATE',  
+                         hover_data=['COUNT'] if aggregated else None,
+                         animation_frame='FRAME',
                          zoom=4,
                          height=600,
                          title="Earthquake Activity Over Time",
                          mapbox_style="carto-positron",  
                         )
+    return fig
+
+# Default widget values of the page
+def warm_up(catalog):
+    build_figure(catalog, catalog.digest, BUCKETS[0], 500, False, None, None)
+
+def run():
+    with span("load"):
+        catalog = load_catalog()
+
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        bucket = st.selectbox("Frame Interval", BUCKETS, index=0)
+    with col2:
+        budget = st.select_slider("Maximum Points per Frame", options=POINT_BUDGETS, value=500)
+    with col3:
+        mode = st.radio("Frame Contents", ["Individual Events", "Grid Cell Aggregates"],
+                        help="Frames with more points than the budget keep their strongest events or cells")
+
+    # The region and aftershock filters chosen in the sidebar of the other
+    # map pages apply here too
+    region, declustering = selection_region(), selection_declustering()
+    if region is not None:
+        st.caption(f"Showing events {describe(region)}")
+    if declustering is not None:
+        st.caption(f"Mainshocks only ({declustering} windows)")
+
+    with span("figure"):
+        fig = build_figure(catalog, catalog.digest, bucket, budget, mode == "Grid Cell Aggregates", region, declustering)
 
-    st.plotly_chart(fig, use_container_width=True)
+    with span("render", payload=fig.to_json):
+        st.plotly_chart(fig, use_container_width=True)
 
     with st.expander("Map Details & Interpretation"):
         st.markdown("""
@@ -0,0 +1,304 @@
+import argparse
+import json
+import logging
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import streamlit as st
+from streamlit import config
+
+from aggregate import LEVELS, pyramid
+from catalog import CSV_PATH, load_catalog
+from cube import MAG_STEP
+from decluster import WINDOWS
+from filters import select
+from partitions import partitions
+from spatial import PRESETS
+
+# Local HTTP API over the catalog the dashboard shows, for other tools:
+#
+#   python api.py --port 8502
+#
+#   GET /catalog                         version, digest and size
+#   GET /events?...&format=ndjson|arrow  the selected events, streamed
+#   GET /stats/yearly?...                events per year
+#   GET /stats/magnitudes?...            events per 0.1 magnitude bin
+#   GET /stats/cells?...&size=0.5        events, magnitudes and energy per grid cell
+#
+# Every endpoint takes the sidebar's filters: min_mag, start_year, end_year,
+# depth=min,max, region=<preset name> or radius=lat,lon,km or
+# bbox=south,west,north,east, and mainshocks=<aftershock windows>.
+# Aggregates are cached per query and catalog content; event lists are
+# written a chunk of rows at a time and never held whole.
+PORT = 8502
+CHUNK_ROWS = 10_000
+CELL_SIZE = 0.5
+CACHE_SIZE = 256
+
+EVENT_COLUMNS = ["TIME", "LAT", "LON", "DEPTH", "MAG"]
+
+log = logging.getLogger(__name__)
+
+
+class BadRequest(ValueError):
+    pass
+
+
+def _numbers(query, name, count=None, cast=float):
+    if name not in query:
+        return None
+    try:
+        values = [cast(value) for value in query[name][-1].split(",")]
+    except ValueError:
+        raise BadRequest(f"{name} must be numeric") from None
+    if count is not None and len(values) != count:
+        raise BadRequest(f"{name} takes {count} comma-separated values")
+    return values
+
+
+def parse_filters(query):
+    # The sidebar's filter tuple, trailing Nones trimmed as there
+    min_mag = _numbers(query, "min_mag", 1)
+    start_year = _numbers(query, "start_year", 1, int)
+    end_year = _numbers(query, "end_year", 1, int)
+    depth = _numbers(query, "depth", 2)
+
+    region = None
+    if "region" in query:
+        if query["region"][-1] not in PRESETS:
+            raise BadRequest(f"region must be one of {', '.join(PRESETS)}")
+        region = PRESETS[query["region"][-1]]
+    elif "radius" in query:
+        region = ("radius", *_numbers(query, "radius", 3))
+    elif "bbox" in query:
+        region = ("bbox", *_numbers(query, "bbox", 4))
+
+    declustering = query.get("mainshocks", [None])[-1]
+    if declustering is not None and declustering not in WINDOWS:
+        raise BadRequest(f"mainshocks must be one of {', '.join(WINDOWS)}")
+
+    filters = (
+        None if min_mag is None else min_mag[0],
+        None if start_year is None else start_year[0],
+        None if end_year is None else end_year[0],
+        None if depth is None else tuple(depth),
+        region,
+        declustering,
+    )
+    while filters and filters[-1] is None:
+        filters = filters[:-1]
+    return filters
+
+
+def yearly(catalog, rows):
+    years = catalog.columns["EPOCH"][rows].view("datetime64[ns]").astype("datetime64[Y]").astype(np.int64) + 1970
+    values, counts = np.unique(years, return_counts=True)
+    return {"year": values.tolist(), "count": counts.tolist()}
+
+
+def magnitudes(catalog, rows):
+    bins = np.rint(catalog.columns["MAG"][rows].astype(np.float64) / MAG_STEP).astype(np.int64)
+    values, counts = np.unique(bins, return_counts=True)
+    return {"mag": (values * MAG_STEP).round(1).tolist(), "count": counts.tolist()}
+
+
+def cells(catalog, rows, size):
+    if size not in LEVELS:
+        raise BadRequest(f"size must be one of {', '.join(map(str, LEVELS))}")
+    table = pyramid(catalog).aggregate(rows, LEVELS.index(size))
+    table = table.drop(columns="MAG_SUM").round({"LAT": 4, "LON": 4, "MAG_MAX": 1, "MAG_MEAN": 2})
+    return {"size": size, **{column.lower(): table[column].tolist() for column in table.columns}}
+
+
+STATS = {"/stats/yearly": yearly, "/stats/magnitudes": magnitudes, "/stats/cells": cells}
+
+
+def stat_options(path, query):
+    # Arguments of a statistic beyond the selected rows
+    if path != "/stats/cells":
+        return ()
+    size = _numbers(query, "size", 1)
+    return (CELL_SIZE if size is None else size[0],)
+
+
+def event_rows(catalog, filters):
+    # Rows of /events. Magnitude, year and depth filters alone are resolved
+    # from the month partitions, reading only the row ranges whose zone maps
+    # allow a match, so streaming events needs no catalog-wide index; region
+    # and mainshock filters do
+    if len(filters) <= 4:
+        return partitions(catalog, "M").scan(catalog.columns, *filters)
+    return select(catalog, *filters)
+
+
+def event_chunks(catalog, rows):
+    # The selected events as small frames of CHUNK_ROWS rows
+    columns = catalog.columns
+    for start in range(0, len(rows), CHUNK_ROWS):
+        chunk = rows[start:start + CHUNK_ROWS]
+        yield pd.DataFrame({
+            "TIME": columns["EPOCH"][chunk].view("datetime64[ns]"),
+            "LAT": columns["LAT"][chunk],
+            "LON": columns["LON"][chunk],
+            "DEPTH": columns["DEPTH"][chunk],
+            "MAG": columns["MAG"][chunk],
+        })
+
+
+class ResponseCache:
+    # Least recently used JSON bodies; the key holds the catalog digest, so a
+    # new catalog version never sees the previous one's answers
+    def __init__(self, size=CACHE_SIZE):
+        self._entries = OrderedDict()
+        self._size = size
+        self._lock = threading.Lock()
+
+    def get_or_build(self, key, build):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+        body = build()
+        with self._lock:
+            self._entries[key] = body
+            if len(self._entries) > self._size:
+                self._entries.popitem(last=False)
+        return body
+
+
+class _ChunkedWriter:
+    # File object that sends every write as one HTTP/1.1 chunk
+    def __init__(self, stream):
+        self.stream = stream
+        self.closed = False
+
+    def write(self, data):
+        if len(data):
+            self.stream.write(f"{len(data):X}\r\n".encode() + bytes(data) + b"\r\n")
+        return len(data)
+
+    def flush(self):
+        self.stream.flush()
+
+    def close(self):
+        self.closed = True
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "EarthquakeAPI"
+    catalog_path = CSV_PATH
+    cache = ResponseCache()
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        try:
+            catalog = load_catalog(self.catalog_path)
+            if url.path == "/catalog":
+                self._json(200, {"version": catalog.version, "digest": catalog.digest, "rows": len(catalog)}, catalog)
+            elif url.path == "/events":
+                self._events(catalog, query)
+            elif url.path in STATS:
+                filters = parse_filters(query)
+                options = stat_options(url.path, query)
+                key = (catalog.digest, url.path, filters, options)
+                body = self.cache.get_or_build(key, lambda: json.dumps(
+                    STATS[url.path](catalog, select(catalog, *filters), *options)).encode())
+                self._send(200, body, catalog)
+            else:
+                self._json(404, {"error": f"no endpoint {url.path}"})
+        except BadRequest as e:
+            self._json(400, {"error": str(e)})
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        except Exception as e:
+            log.exception("Request %s failed", self.path)
+            self._json(500, {"error": repr(e)})
+
+    def _events(self, catalog, query):
+        rows = event_rows(catalog, parse_filters(query))
+        form = query.get("format", ["ndjson"])[-1]
+        if form not in ("ndjson", "arrow"):
+            raise BadRequest("format must be ndjson or arrow")
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson" if form == "ndjson" else "application/vnd.apache.arrow.stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.send_header("X-Catalog-Digest", catalog.digest)
+        self.send_header("X-Event-Count", str(len(rows)))
+        self.end_headers()
+
+        out = _ChunkedWriter(self.wfile)
+        try:
+            if form == "ndjson":
+                for frame in event_chunks(catalog, rows):
+                    out.write(frame.to_json(orient="records", lines=True, date_format="iso", double_precision=4).encode() + b"\n")
+            else:
+                schema = pa.schema([("TIME", pa.timestamp("ns"))] + [(name, pa.float32()) for name in EVENT_COLUMNS[1:]])
+                with pa.ipc.new_stream(out, schema) as writer:
+                    for frame in event_chunks(catalog, rows):
+                        writer.write_batch(pa.RecordBatch.from_pandas(frame, schema=schema, preserve_index=False))
+        except (BrokenPipeError, ConnectionResetError):
+            raise
+        except Exception:
+            # The status is sent already; without the final chunk the client
+            # sees a truncated response rather than a complete one
+            log.exception("Streaming %s failed", self.path)
+            self.close_connection = True
+            return
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _json(self, status, payload, catalog=None):
+        self._send(status, json.dumps(payload).encode(), catalog)
+
+    def _send(self, status, body, catalog=None):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        if catalog is not None:
+            self.send_header("X-Catalog-Digest", catalog.digest)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        log.info("%s %s", self.address_string(), format % args)
+
+
+def serve(host="127.0.0.1", port=PORT, path=CSV_PATH):
+    Handler.catalog_path = path
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve filtered and aggregated catalog data over HTTP.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--catalog", default=CSV_PATH, help="catalog CSV file")
+    args = parser.parse_args()
+
+    # Bare-mode cache warnings are expected here
+    config.set_option("logger.level", "error")
+    st.logger.set_log_level("error")
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+
+    # Parsed before the first request rather than during it
+    load_catalog(args.catalog)
+    server = serve(args.host, args.port, args.catalog)
+    log.info("Serving %s on http://%s:%d", args.catalog, args.host, args.port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+
+
+if __name__ == "__main__":
+    main()
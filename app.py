@@ -1,5 +1,10 @@
 import streamlit as st
 import importlib
+import perf
+import warmup
+
+# Pre-parse the catalog and pre-build every page's default view in the background
+warmup.start()
 
 def load_css(file_name):
     try:
@@ -23,7 +28,9 @@ buttons = [
     ("🌵 Spike Map", 'spikeMap'),
     ("📊 Heat Map", 'heatMap'),
     ("🎞️ Animated Map", 'animatedMap'),
-    ("🔁 Flow Map", 'flowMap')
+    ("🔁 Flow Map", 'flowMap'),
+    ("📉 b-value Map", 'bValueMap'),
+    ("⏱️ Seismicity Rate", 'seismicRate')
 ]
 
 cols = st.columns(len(buttons))
@@ -38,16 +45,23 @@ pages = {
     "heatMap": "heatMap",
     "animatedMap": "animatedMap",
     "descriptiveStat": "descriptiveStat",
-    "flowMap": "flowMap"
+    "flowMap": "flowMap",
+    "bValueMap": "bValueMap",
+    "seismicRate": "seismicRate"
 }
 
 def load_page(page_name):
     try:
-        module = importlib.import_module(pages[page_name])
-        module.run()
+        with perf.rerun(page_name):
+            with perf.span("import"):
+                module = importlib.import_module(pages[page_name])
+            module.run()
     except Exception as e:
         st.error(f" Error loading `{page_name}`: {e}")
 
+    if perf.debug_enabled():
+        perf.debug_panel(page_name)
+
 if 'clear_content' not in st.session_state:
     st.session_state.clear_content = False
 
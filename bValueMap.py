@@ -0,0 +1,137 @@
+import numpy as np
+import streamlit as st
+from aggregate import LEVELS
+from catalog import load_catalog
+from gutenberg import gutenberg_richter
+from perf import span
+from persist import figure_from_json, figure_json, persistent
+from sidebar import selection_declustering
+from transport import floats, integers
+
+CELL_SIZES = [1.0, 0.5, 0.25, 0.1]
+WINDOWS = {"Whole Catalog": None, "10 Years": 10, "5 Years": 5, "1 Year": 1}
+MIN_EVENTS = 50
+
+def build_fmd_figure(engine):
+    import plotly.graph_objects as go
+
+    # Frequency-magnitude distribution with the fitted Gutenberg-Richter line
+    overall = engine.overall
+    cumulative = engine.histogram[::-1].cumsum()[::-1]
+    fig = go.Figure([
+        go.Bar(x=engine.magnitudes, y=engine.histogram, name="Events per bin", marker_color="lightsteelblue"),
+        go.Scatter(x=engine.magnitudes, y=cumulative, mode="markers", name="Events ≥ M", marker=dict(color="black", size=5)),
+    ])
+    if not np.isnan(overall["B"]):
+        fitted = engine.magnitudes[engine.magnitudes >= overall["MC"]]
+        fig.add_trace(go.Scatter(
+            x=fitted,
+            y=10 ** (overall["A"] - overall["B"] * fitted),
+            mode="lines",
+            line=dict(color="red"),
+            name=f"log N = {overall['A']:.2f} − {overall['B']:.2f} M",
+        ))
+        fig.add_vline(x=overall["MC"], line_dash="dash", annotation_text=f"Mc {overall['MC']:.1f}")
+    fig.update_layout(
+        title="Frequency-Magnitude Distribution",
+        xaxis_title="Magnitude",
+        yaxis_title="Earthquakes",
+        yaxis_type="log",
+        legend=dict(orientation="h", y=-0.2),
+    )
+    return fig
+
+@st.cache_data(max_entries=16, show_spinner="Mapping b-values...")
+@persistent("bValueMap.figure", dump=figure_json, load=figure_from_json)
+def build_map_figure(_engine, digest, level, years, declustering, start, min_events):
+    import plotly.graph_objects as go
+
+    cells = _engine.window(start, min_events)
+    fig = go.Figure(go.Scattermap(
+        lat=floats(cells["LAT"]),
+        lon=floats(cells["LON"]),
+        mode="markers",
+        marker=dict(
+            size=10,
+            color=floats(cells["B"]),
+            colorscale="RdYlBu",
+            cmin=0.5,
+            cmax=1.5,
+            colorbar=dict(title="b-value"),
+        ),
+        customdata=np.column_stack([floats(cells["B_ERR"]), floats(cells["MC"]), integers(cells["N"]).astype(np.float32)]),
+        hovertemplate=(
+            "b = %{marker.color:.2f} ± %{customdata[0]:.2f}<br>"
+            "Mc = %{customdata[1]:.1f}<br>Events ≥ Mc: %{customdata[2]}<extra></extra>"
+        ),
+    ))
+    center = {"lat": 46.0, "lon": 25.0} if cells.empty else {"lat": float(cells["LAT"].mean()), "lon": float(cells["LON"].mean())}
+    fig.update_layout(
+        map_style="carto-positron",
+        map_zoom=5,
+        map_center=center,
+        margin={"r": 0, "t": 50, "l": 0, "b": 0},
+        height=600,
+        title=f"b-values in {_engine.size}° cells",
+    )
+    return fig
+
+# Default widget values of the page
+def warm_up(catalog):
+    level = LEVELS.index(CELL_SIZES[1])
+    engine = gutenberg_richter(catalog, level, None, None)
+    build_fmd_figure(engine)
+    build_map_figure(engine, catalog.digest, level, None, None, int(engine.windows()[0]) if len(engine.cells) else 0, MIN_EVENTS)
+
+def run():
+    st.title("Gutenberg-Richter b-value Map")
+    with span("load"):
+        catalog = load_catalog()
+
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        size = st.selectbox("Cell Size (degrees)", CELL_SIZES, index=1)
+    with col2:
+        window = st.selectbox("Time Window", list(WINDOWS), index=0)
+    with col3:
+        min_events = st.slider("Minimum Events above Mc", 10, 200, MIN_EVENTS, step=10)
+    level, years = LEVELS.index(size), WINDOWS[window]
+
+    # Fitted to the mainshocks alone when the map pages' sidebar asks for them
+    declustering = selection_declustering()
+    if declustering is not None:
+        st.caption(f"Mainshocks only ({declustering} windows)")
+
+    with span("aggregate"):
+        engine = gutenberg_richter(catalog, level, years, declustering)
+    if engine.cells.empty:
+        st.warning("No events to fit.")
+        return
+
+    overall = engine.overall
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Catalog b-value", f"{overall['B']:.2f} ± {overall['B_ERR']:.2f}")
+    col2.metric("Magnitude of Completeness", f"{overall['MC']:.1f}")
+    col3.metric("Events ≥ Mc", f"{overall['N']:,}")
+
+    starts = engine.windows()
+    start = int(starts[0])
+    if len(starts) > 1:
+        start = st.select_slider("Window Starting", options=starts.tolist(), value=start)
+
+    with span("figure"):
+        fig = build_map_figure(engine, catalog.digest, level, years, declustering, start, min_events)
+
+    with span("render", payload=fig.to_json):
+        st.plotly_chart(fig, use_container_width=True)
+    st.caption(f"Cells with at least {min_events} events above their own Mc; Mc by maximum curvature + 0.2.")
+
+    st.plotly_chart(build_fmd_figure(engine), use_container_width=True)
+
+    with st.expander("Map Details & Interpretation"):
+        st.markdown("""
+            The Gutenberg-Richter law, log N = a − b M, relates the number of earthquakes N of magnitude M or larger to M.
+            The b-value is estimated by maximum likelihood (Aki, 1965) above the magnitude of completeness Mc, the smallest magnitude
+            at which the catalog records essentially every event. Values near 1 are typical of tectonic seismicity; lower values indicate
+            a larger share of strong events (often linked to high stress), higher values a larger share of small ones (swarms, volcanic or induced activity).
+                    """)
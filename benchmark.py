@@ -0,0 +1,272 @@
+import argparse
+import contextlib
+import datetime
+import json
+import os
+import platform
+import shutil
+import subprocess
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+from streamlit import config
+
+# Bare-mode cache warnings are expected here; the page modules below log one
+# for every cached function as they are imported
+config.set_option("logger.level", "error")
+st.logger.set_log_level("error")
+
+import animatedMap
+import bValueMap
+import catalog as catalog_module
+import descriptiveStat
+import flowMap
+import heatMap
+import persist
+import seismicRate
+import spikeMap
+from catalog import read_catalog
+from correlation import PrefixTable
+from cube import Cube
+from decluster import Declustering
+from filters import FilterIndex, filter_index, select
+from gutenberg import GutenbergRichter
+from rates import SeismicityRate
+from selection import Selection
+from spatial import PRESETS
+
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000]
+PAGES = ["sidebar", "region", "declustering", "descriptiveStat", "spikeMap", "heatMap", "flowMap", "animatedMap", "bValueMap", "seismicRate"]
+
+
+# Synthetic catalog with the schema and quirks of dataOUT/earthquakes.csv:
+# TIME with and without fractional seconds, missing magnitudes, zero,
+# negative and missing depths, and a few non-positive magnitudes
+def synthetic_catalog(size, seed=0):
+    rng = np.random.default_rng(seed)
+    start = np.datetime64("2000-01-01T00:00:00", "ms").astype(np.int64)
+    end = np.datetime64("2025-01-01T00:00:00", "ms").astype(np.int64)
+    stamps = np.sort(rng.integers(start, end, size)).astype("datetime64[ms]")
+
+    date = np.datetime_as_string(stamps, unit="D")
+    time_of_day = pd.Series(np.datetime_as_string(stamps, unit="ms")).str[11:22]
+    whole_seconds = rng.random(size) < 0.07
+    time_of_day[whole_seconds] = time_of_day[whole_seconds].str[:8]
+
+    # Two clusters, like Vrancea and the Silesian mining region
+    vrancea = rng.random(size) < 0.4
+    lat = np.where(vrancea, rng.normal(45.7, 0.3, size), rng.uniform(44.6, 50.0, size))
+    lon = np.where(vrancea, rng.normal(26.5, 0.3, size), rng.uniform(17.0, 27.4, size))
+
+    depth = np.where(vrancea, rng.uniform(60, 200, size), rng.exponential(8, size)).round(1)
+    depth[rng.random(size) < 0.5] = 0.0
+    depth[rng.random(size) < 0.001] = -0.5
+    depth[rng.random(size) < 0.002] = np.nan
+
+    # Gutenberg-Richter magnitudes with b = 1 above M 0.5
+    mag = (0.5 + rng.exponential(1 / np.log(10), size)).round(1)
+    mag[rng.random(size) < 0.45] = np.nan
+    mag[rng.random(size) < 0.002] = -0.5
+
+    return pd.DataFrame({
+        "DATE": date,
+        "TIME": time_of_day,
+        "LAT": lat.round(4),
+        "LON": lon.round(4),
+        "DEPTH": depth,
+        "MAG": mag,
+    })
+
+
+# Each stage runs the data preparation a page performs, bypassing the
+# Streamlit caches, and returns the object that would be sent to the browser
+def stage_sidebar(catalog):
+    index = FilterIndex(catalog)
+    filters = (4.0, int(index.years[0]), int(index.years[-1]))
+    selection = Selection(catalog, filters, index.query(*filters))
+    return selection.materialise(catalog), None
+
+
+def stage_region(catalog):
+    filters = (4.0, None, None, None, PRESETS["Vrancea zone"])
+    selection = Selection(catalog, filters, select(catalog, *filters))
+    return selection.materialise(catalog), None
+
+
+def stage_declustering(catalog):
+    return Declustering(catalog, "Gardner-Knopoff"), None
+
+
+def stage_descriptiveStat(catalog):
+    data = catalog.view(dropna=["DATE"], positive=["MAG", "DEPTH"])
+    stats = Cube.build(data)
+    summary = stats.summary()
+    stats.counts("YEAR")
+    stats.magnitude_histogram()
+    stats.mean_magnitude("YEAR")
+    table = PrefixTable(data["MAG"].to_numpy(), data["DEPTH"].to_numpy())
+    mag_range = (summary["Minimum Magnitude"], summary["Maximum Magnitude"])
+    depth_range = (summary["Shallowest Earthquake (km)"], summary["Deepest Earthquake (km)"])
+    return None, lambda: descriptiveStat.build_correlation_figure(table, mag_range, depth_range).to_json()
+
+
+def _all_rows(catalog):
+    return filter_index(catalog).query()
+
+
+def stage_spikeMap(catalog):
+    cells, size = spikeMap.build_cells.__wrapped__(catalog, _all_rows(catalog), None)
+    deck = spikeMap.build_deck(cells, size)
+    return None, deck.to_json
+
+
+def stage_heatMap(catalog):
+    data = catalog.take(_all_rows(catalog))
+    heat, markers = heatMap.build_layers.__wrapped__(catalog, data, None)
+    earthquake_map = heatMap.build_map(heat, markers)
+    return None, lambda: earthquake_map.get_root().render()
+
+
+def stage_flowMap(catalog):
+    data = catalog.take(_all_rows(catalog))
+    fig = flowMap.build_figure.__wrapped__(data, None, flowMap.MAX_FRAMES)
+    return None, fig.to_json
+
+
+def stage_animatedMap(catalog):
+    fig = animatedMap.build_figure.__wrapped__(catalog, catalog.digest, "Year", 500, False, None, None)
+    return None, fig.to_json
+
+
+def stage_bValueMap(catalog):
+    # Finest cell size the page offers, per year
+    engine = GutenbergRichter(catalog, bValueMap.LEVELS.index(bValueMap.CELL_SIZES[-1]), 1)
+    start = int(engine.windows()[-1])
+    fig = bValueMap.build_map_figure.__wrapped__(engine, None, None, None, None, start, bValueMap.MIN_EVENTS)
+    return None, fig.to_json
+
+
+def stage_seismicRate(catalog):
+    # Shortest window over the finest cells the page offers
+    SeismicityRate(catalog, seismicRate.LEVELS.index(seismicRate.CELL_SIZES[-1]), seismicRate.WINDOWS["1 Hour"])
+    fig = seismicRate.build_figure.__wrapped__(
+        catalog, None, seismicRate.LEVELS.index(seismicRate.CELL_SIZES[-1]), seismicRate.WINDOWS["1 Hour"],
+        None, None, seismicRate.PROBABILITIES["1 in a million"], None)
+    return None, fig.to_json
+
+
+def measure(function, *args):
+    tracemalloc.start()
+    start = time.perf_counter()
+    _, serialize = function(*args)
+    wall = time.perf_counter() - start
+
+    payload, serialize_s = None, None
+    if serialize is not None:
+        start = time.perf_counter()
+        payload = len(serialize().encode())
+        serialize_s = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {
+        "wall_s": round(wall, 4),
+        "serialize_s": None if serialize_s is None else round(serialize_s, 4),
+        "peak_mb": round(peak / 2**20, 2),
+        "payload_bytes": payload,
+    }
+
+
+def run_scale(size, workdir, pages):
+    path = os.path.join(workdir, f"earthquakes-{size}.csv")
+    if not os.path.exists(path):
+        synthetic_catalog(size).to_csv(path, index=False)
+
+    results = []
+
+    # Cold catalog load: CSV parse plus the binary columnar copy
+    shutil.rmtree(catalog_module.CACHE_DIR, ignore_errors=True)
+    st.cache_resource.clear()
+    row = measure(lambda: (read_catalog(path), None))
+    results.append({"scale": size, "page": "catalog", **row})
+    print_row(results[-1])
+
+    for page in pages:
+        # Every page starts from a fresh Catalog (memory-mapped, nothing derived yet)
+        st.cache_resource.clear()
+        st.cache_data.clear()
+        catalog = read_catalog(path)
+        row = measure(globals()[f"stage_{page}"], catalog)
+        results.append({"scale": size, "page": page, **row})
+        print_row(results[-1])
+    return results
+
+
+def print_row(row):
+    payload = "-" if row["payload_bytes"] is None else f"{row['payload_bytes'] / 2**20:.2f} MB"
+    print(f"{row['scale']:>10,}  {row['page']:<16} {row['wall_s']:>9.3f} s  {row['peak_mb']:>9.1f} MB peak  {payload:>10}")
+
+
+def compare(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = {(r["scale"], r["page"]): r for r in json.load(f)["results"]}
+    print(f"\nWall time vs {baseline_path}:")
+    for row in results:
+        before = baseline.get((row["scale"], row["page"]))
+        if before and before["wall_s"]:
+            print(f"{row['scale']:>10,}  {row['page']:<16} {row['wall_s'] / before['wall_s']:>6.2f}x")
+
+
+def metadata():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    return {
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "machine": platform.machine(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the data preparation of every page on synthetic catalogs.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES,
+                        help="catalog sizes to generate, e.g. 10000 100000 1000000 10000000")
+    parser.add_argument("--pages", nargs="+", choices=PAGES, default=PAGES)
+    parser.add_argument("--output", default="benchmark-results.json", help="where to write the JSON results")
+    parser.add_argument("--compare", help="earlier results file to compare wall times against")
+    parser.add_argument("--workdir", help="directory for the generated CSV files (default: a temporary directory)")
+    args = parser.parse_args()
+
+    if args.workdir:
+        os.makedirs(args.workdir, exist_ok=True)
+    # A temporary directory is removed with everything generated in it; one
+    # given with --workdir is kept
+    with contextlib.nullcontext(args.workdir) if args.workdir else tempfile.TemporaryDirectory(prefix="earthquake-bench-") as workdir:
+        # Keep the benchmark's binary catalogs away from the real one, and time
+        # the computations rather than reads from the disk cache
+        catalog_module.CACHE_DIR = os.path.join(workdir, ".catalog")
+        persist.CACHE_DIR = None
+
+        results = []
+        for size in args.sizes:
+            results.extend(run_scale(size, workdir, args.pages))
+
+    with open(args.output, "w") as f:
+        json.dump({"meta": metadata(), "results": results}, f, indent=2)
+    print(f"\nResults written to {args.output}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
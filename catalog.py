@@ -0,0 +1,456 @@
+import hashlib
+import io
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+import weakref
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from partitions import GRAINS, partition_table
+from timestamps import NAT, parse_epoch
+
+CSV_PATH = "dataOUT/earthquakes.csv"
+CARPATHIANS_PATH = "dataIN/Carpathians_Earthquakes.csv"
+CACHE_DIR = "dataOUT/.catalog"
+
+# Bytes of a catalog file parsed at a time when it is streamed
+BLOCK_BYTES = 64 * 2**20
+
+# Seconds between checks of the catalog file for changes; 0 turns the watcher
+# off and every rerun checks the file itself, as before
+WATCH_INTERVAL_S = float(os.environ.get("EARTHQUAKE_WATCH_INTERVAL", 2.0))
+
+# Compact on-disk layout of the catalog: one memory-mapped .npy file per column
+SCHEMA = {
+    "EPOCH": np.int64,
+    "LAT": np.float32,
+    "LON": np.float32,
+    "DEPTH": np.float32,
+    "MAG": np.float32,
+}
+
+log = logging.getLogger(__name__)
+
+
+class Catalog:
+    # Read-only columnar catalog shared by every page and session of the process.
+    # version tells catalog files apart cheaply on one machine; digest is the
+    # hash of the file's content and identifies it across processes and hosts;
+    # path is the CSV file it was read from
+    def __init__(self, columns, version, digest=None, meta=None, path=None):
+        self.columns = columns
+        self.path = path
+        self.version = version
+        self.digest = digest or version
+        self.meta = meta or {}
+        self._derived = {}
+        self._building = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.columns["EPOCH"])
+
+    @property
+    def nbytes(self):
+        return sum(column.nbytes for column in self.columns.values())
+
+    def derived(self, key, build):
+        # Indexes, views and aggregates are computed once per catalog version;
+        # a session asking for one the warm-up thread is building waits for it
+        if key not in self._derived:
+            with self._lock:
+                building = self._building.setdefault(key, threading.Lock())
+            with building:
+                if key not in self._derived:
+                    self._derived[key] = build(self)
+        return self._derived[key]
+
+    def clean_rows(self, dropna=(), positive=()):
+        # Positions of the rows with values in the dropna columns and positive
+        # values in the positive ones, shared instead of recomputed every rerun
+        key = ("clean_rows", tuple(dropna), tuple(positive))
+        return self.derived(key, lambda catalog: _clean(catalog.columns, dropna, positive))
+
+    def view(self, dropna=(), positive=()):
+        # Cleaned subset of the catalog as a frame indexed by catalog position
+        return self.take(self.clean_rows(dropna, positive))
+
+    def take(self, index):
+        # Frames hold copies of only the rows asked for; no frame of the whole
+        # catalog is kept beside the memory-mapped columns
+        return _frame(self.columns, np.asarray(index, dtype=np.int64))
+
+    def view_since(self, start, dropna=(), positive=()):
+        # Cleaned frame of the rows from start on, indexed by catalog position
+        return self.take(start + _clean(self.columns, dropna, positive, start))
+
+    def inherit(self, previous, start):
+        # previous is this catalog without the rows appended from start on.
+        # Derived structures that can take the new rows are extended instead
+        # of being rebuilt; the others are built again when first asked for.
+        for key, value in list(previous._derived.items()):
+            # Another structure's extension may have asked for this one already
+            if key in self._derived:
+                continue
+            if hasattr(type(value), "extend"):
+                self._derived[key] = value.extend(self, start)
+
+
+def _frame(columns, rows):
+    datetime = columns["EPOCH"][rows].view("datetime64[ns]")
+    return pd.DataFrame({
+        "DATE": datetime.astype("datetime64[D]").astype("datetime64[ns]"),
+        "DATETIME": datetime,
+        "LAT": columns["LAT"][rows],
+        "LON": columns["LON"][rows],
+        "DEPTH": columns["DEPTH"][rows],
+        "MAG": columns["MAG"][rows],
+    }, index=pd.Index(rows))
+
+
+def _clean(columns, dropna, positive, start=0):
+    # DATE and DATETIME are missing where EPOCH is NaT
+    mask = np.ones(len(columns["EPOCH"]) - start, dtype=bool)
+    for name in dropna:
+        if name in ("DATE", "DATETIME"):
+            mask &= columns["EPOCH"][start:] != NAT
+        else:
+            mask &= ~np.isnan(columns[name][start:])
+    for name in positive:
+        mask &= columns[name][start:] > 0
+    return np.flatnonzero(mask)
+
+
+def fingerprint(path=CSV_PATH):
+    stat = os.stat(path)
+    return f"{stat.st_size}-{stat.st_mtime_ns}"
+
+
+def content_digest(path=CSV_PATH):
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(2**20), b""):
+            sha.update(block)
+    return sha.hexdigest()[:32]
+
+
+def _digest(data):
+    return hashlib.sha256(data).hexdigest()[:32]
+
+
+def _read_earthquakes(data):
+    frame = pd.read_csv(io.BytesIO(data), dtype={"DATE": str, "TIME": str})
+    frame.columns = frame.columns.str.strip()
+    return frame
+
+
+def _read_carpathians(data):
+    # The layout the heat map used to read: an index column, then three
+    # leading and three trailing bookkeeping columns around the event fields
+    frame = pd.read_csv(io.BytesIO(data), index_col=0, dtype={"DATE": str, "TIME": str}).reset_index()
+    frame = frame.drop(frame.columns[list(range(3)) + list(range(-4, -1))], axis=1)
+    frame.columns = frame.columns.str.strip()
+    return frame
+
+
+# Readers that normalise a source file to DATE, TIME, LAT, LON, DEPTH, MAG;
+# every layout ends up in the same binary store
+LAYOUTS = {
+    "earthquakes": _read_earthquakes,
+    "carpathians": _read_carpathians,
+}
+
+SOURCES = {
+    os.path.normpath(CSV_PATH): "earthquakes",
+    os.path.normpath(CARPATHIANS_PATH): "carpathians",
+}
+
+
+def layout_of(path):
+    return SOURCES.get(os.path.normpath(path), "earthquakes")
+
+
+def parse_csv(path=CSV_PATH):
+    with open(path, "rb") as f:
+        return _parse(f.read(), layout_of(path))
+
+
+def split_csv(path, parts):
+    # Byte offsets cutting the rows of a catalog file into parts ranges of
+    # whole lines, the header excluded
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        offsets = [len(f.readline())]
+        for part in range(1, parts):
+            f.seek(max(offsets[0], size * part // parts) - 1)
+            f.readline()
+            offsets.append(max(f.tell(), offsets[-1]))
+    return list(zip(offsets, offsets[1:] + [size]))
+
+
+def read_csv_blocks(path, start=None, stop=None, block_bytes=BLOCK_BYTES):
+    # Columns of the lines between the byte offsets start and stop (the whole
+    # file by default), parsed block_bytes at a time so that a file larger
+    # than memory can be streamed. start must be the start of a line.
+    layout = layout_of(path)
+    with open(path, "rb") as f:
+        header = f.readline()
+        stop = os.path.getsize(path) if stop is None else stop
+        f.seek(len(header) if start is None else start)
+        carry = b""
+        while f.tell() < stop:
+            data = carry + f.read(min(block_bytes, stop - f.tell()))
+            cut = data.rfind(b"\n") + 1 if f.tell() < stop else len(data)
+            data, carry = data[:cut], data[cut:]
+            if data.strip():
+                yield _parse(header + data, layout)
+
+
+def _parse(data, layout="earthquakes"):
+    data = LAYOUTS[layout](data)
+
+    columns = {"EPOCH": parse_epoch(data["DATE"], data["TIME"] if "TIME" in data else None)}
+    for name in ("LAT", "LON", "DEPTH", "MAG"):
+        columns[name] = data[name].to_numpy(SCHEMA[name])
+
+    # Chronological order lets time ranges resolve to contiguous row ranges
+    order = np.argsort(columns["EPOCH"], kind="stable")
+    return {name: column[order] for name, column in columns.items()}
+
+
+def _cache_root(path):
+    return os.path.join(CACHE_DIR, os.path.splitext(os.path.basename(path))[0])
+
+
+def _ingest(data, previous, layout="earthquakes"):
+    # Columns for the file content data. When data is an earlier version's
+    # content with rows appended, only the new tail is parsed and merged into
+    # that version's columns; returns the columns and, if the new rows simply
+    # follow the old ones, the position of the first new row
+    if previous is not None:
+        columns, meta = previous
+        offset = meta.get("bytes", 0)
+        appended = (
+            0 < offset < len(data)
+            and data[offset - 1:offset] == b"\n"
+            and _digest(memoryview(data)[:offset]) == meta.get("digest")
+        )
+        if appended:
+            header = data[:data.index(b"\n") + 1]
+            tail = _parse(header + data[offset:], layout)
+            start = len(columns["EPOCH"])
+            merged = {name: np.concatenate([columns[name], tail[name]]) for name in SCHEMA}
+            if len(tail["EPOCH"]) and start and tail["EPOCH"][0] < columns["EPOCH"][-1]:
+                # Late events (or undated ones, which sort first) go to their
+                # place; the same stable order a full parse would give
+                order = np.argsort(merged["EPOCH"], kind="stable")
+                return {name: column[order] for name, column in merged.items()}, None
+            return merged, start
+    return _parse(data, layout), None
+
+
+def _latest(root):
+    # Columns and metadata of the most recently written version, if any
+    latest = None
+    for entry in os.listdir(root) if os.path.isdir(root) else ():
+        directory = os.path.join(root, entry)
+        if ".tmp-" in entry or not os.path.exists(os.path.join(directory, "meta.json")):
+            continue
+        mtime = os.path.getmtime(os.path.join(directory, "meta.json"))
+        if latest is None or mtime > latest[0]:
+            latest = (mtime, directory)
+    if latest is None:
+        return None
+    return _read_columns(latest[1]), _read_meta(latest[1])
+
+
+def _write_columns(directory, columns, version, digest, meta=None):
+    # Each version gets its own directory, written under a temporary name and
+    # renamed into place so readers never see a half-written catalog
+    tmp = f"{directory}.tmp-{os.getpid()}"
+    os.makedirs(tmp, exist_ok=True)
+    for name, column in columns.items():
+        with open(os.path.join(tmp, f"{name}.npy"), "wb") as f:
+            np.save(f, np.ascontiguousarray(column, dtype=SCHEMA[name]))
+    with open(os.path.join(tmp, "meta.json"), "w") as f:
+        json.dump({
+            "version": version,
+            "digest": digest,
+            "rows": len(columns["EPOCH"]),
+            # Zone maps of the year and month partitions, see partitions.py
+            "partitions": {grain: partition_table(columns, grain) for grain in GRAINS},
+            **(meta or {}),
+        }, f)
+    try:
+        os.rename(tmp, directory)
+    except OSError:
+        # Another process finished the same version first
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def _read_columns(directory):
+    if not os.path.exists(os.path.join(directory, "meta.json")):
+        return None
+    return {
+        name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r")
+        for name in SCHEMA
+    }
+
+
+def _read_meta(directory):
+    with open(os.path.join(directory, "meta.json")) as f:
+        return json.load(f)
+
+
+def _adopt(root, directory, digest):
+    # A rewrite that left the content unchanged (or reverted it) reuses the
+    # binary catalog already written for that content instead of parsing again
+    for entry in os.listdir(root) if os.path.isdir(root) else ():
+        previous = os.path.join(root, entry)
+        if ".tmp-" in entry or previous == directory or not os.path.exists(os.path.join(previous, "meta.json")):
+            continue
+        if _read_meta(previous).get("digest") == digest:
+            try:
+                os.rename(previous, directory)
+                return True
+            except OSError:
+                return False
+    return False
+
+
+def _remove_stale(root, version):
+    for entry in os.listdir(root):
+        if entry != version and ".tmp-" not in entry:
+            shutil.rmtree(os.path.join(root, entry), ignore_errors=True)
+
+
+@st.cache_resource(max_entries=2, show_spinner="Loading earthquake catalog...")
+def _open(path, version):
+    directory = os.path.join(_cache_root(path), version)
+    columns = _read_columns(directory)
+    if columns is None:
+        with open(path, "rb") as f:
+            data = f.read()
+        digest = _digest(data)
+        root = _cache_root(path)
+        if not _adopt(root, directory, digest):
+            previous = _latest(root)
+            columns, start = _ingest(data, previous, layout_of(path))
+            # bytes is where the next append starts; appended_to and start let
+            # a running process extend what it derived from the previous version
+            meta = {"bytes": len(data)}
+            if start is not None:
+                meta.update(appended_to=previous[1]["version"], start=int(start))
+            _write_columns(directory, columns, version, digest, meta)
+        _remove_stale(root, version)
+        columns = _read_columns(directory)
+    # Binary catalogs written before the digest was recorded hash the file now
+    meta = _read_meta(directory)
+    return Catalog(columns, version, meta.get("digest") or content_digest(path), meta, path)
+
+
+def read_catalog(path=CSV_PATH):
+    # The catalog as the file is now; parses it in the calling thread if needed
+    return _open(path, fingerprint(path))
+
+
+class _BackgroundThreadFilter(logging.Filter):
+    # Cache spinners have no session to draw into from a background thread and
+    # would log a "missing ScriptRunContext" warning for every call
+    names = set()
+
+    def filter(self, record):
+        return record.threadName not in self.names
+
+
+logging.getLogger("streamlit.runtime.scriptrunner_utils.script_run_context").addFilter(_BackgroundThreadFilter())
+
+
+def background_thread(target, name, *args):
+    _BackgroundThreadFilter.names.add(name)
+    thread = threading.Thread(target=target, args=args, name=name, daemon=True)
+    thread.start()
+    return thread
+
+
+class CatalogWatcher:
+    # Polls the catalog file and loads a changed file in the background.
+    # Sessions keep reading the current catalog meanwhile; the new one replaces
+    # it in a single assignment once it is loaded and the on_reload callbacks
+    # (cache warm-up) have run, so every rerun sees exactly one version.
+    def __init__(self, path):
+        self.path = path
+        self.current = read_catalog(path)
+        self.on_reload = []
+        self._pending = None
+        self._unchanged = None
+        background_thread(_watch, f"catalog-watcher-{os.path.basename(path)}", weakref.ref(self))
+
+    def check(self):
+        try:
+            version = fingerprint(self.path)
+        except FileNotFoundError:
+            # Replaced by delete-and-create; look again on the next poll
+            return False
+        if version in (self.current.version, self._unchanged):
+            self._pending = None
+            return False
+        # A writer may still be appending: wait for two identical fingerprints
+        if version != self._pending:
+            self._pending = version
+            return False
+
+        digest = content_digest(self.path)
+        if digest == self.current.digest:
+            # Rewritten with the same content: nothing derived from it is stale
+            self._unchanged, self._pending = version, None
+            return False
+
+        catalog = _open(self.path, version)
+        meta = _read_meta(os.path.join(_cache_root(self.path), version))
+        if meta.get("appended_to") == self.current.version:
+            catalog.inherit(self.current, meta["start"])
+        for callback in self.on_reload:
+            try:
+                callback(catalog)
+            except Exception:
+                log.exception("Catalog reload callback failed")
+        previous, self.current = self.current, catalog
+        self._pending = self._unchanged = None
+        # Only what was derived from the old version goes: its Catalog, with
+        # every index and aggregate built on it, is dropped from the cache.
+        # Page caches are keyed by the catalog digest and age out on their own.
+        _open.clear(self.path, previous.version)
+        log.info("Catalog %s reloaded: %s -> %s, %d events", self.path, previous.version, version, len(catalog))
+        return True
+
+
+def _watch(ref):
+    # Holds the watcher weakly so the thread ends once the watcher is dropped
+    while True:
+        time.sleep(WATCH_INTERVAL_S)
+        watcher = ref()
+        if watcher is None:
+            return
+        try:
+            watcher.check()
+        except Exception:
+            log.exception("Catalog watcher failed")
+        del watcher
+
+
+@st.cache_resource(show_spinner="Loading earthquake catalog...")
+def catalog_watcher(path=CSV_PATH):
+    return CatalogWatcher(path)
+
+
+def load_catalog(path=CSV_PATH):
+    if WATCH_INTERVAL_S <= 0:
+        return read_catalog(path)
+    return catalog_watcher(path).current
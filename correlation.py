@@ -0,0 +1,125 @@
+import copy
+
+import numpy as np
+
+import persist
+from cube import MAG_STEP, events, events_since
+
+# Depths are reported to 0.1 km, so this binning is exact for the catalog
+DEPTH_STEP = 0.1
+
+# n, sum x, sum y, sum xy, sum x^2, sum y^2 with x = DEPTH and y = MAG
+N, SX, SY, SXY, SXX, SYY = range(6)
+
+
+def _bins(mag, depth):
+    return np.rint(mag / MAG_STEP).astype(np.int64), np.rint(depth / DEPTH_STEP).astype(np.int64)
+
+
+class PrefixTable:
+    # 2-D prefix sums of the sufficient statistics over (MAG, DEPTH) bins, so
+    # the correlation and OLS fit of any magnitude/depth rectangle take four
+    # lookups. Values are centred on the global means to keep the sums
+    # numerically stable.
+    def __init__(self, mag, depth, declustering=None):
+        self.declustering = declustering
+        mag = np.asarray(mag, dtype=np.float64)
+        depth = np.asarray(depth, dtype=np.float64)
+        self.x0, self.y0 = depth.mean(), mag.mean()
+
+        mag_bin, depth_bin = _bins(mag, depth)
+        self.mag_origin, self.depth_origin = mag_bin.min(), depth_bin.min()
+        shape = (mag_bin.max() - self.mag_origin + 1, depth_bin.max() - self.depth_origin + 1)
+        self.grids = self._grids(mag, depth, mag_bin, depth_bin, shape)
+        self._accumulate()
+
+    def _grids(self, mag, depth, mag_bin, depth_bin, shape):
+        rows, cols = shape
+        flat = (mag_bin - self.mag_origin) * cols + (depth_bin - self.depth_origin)
+        dx, dy = depth - self.x0, mag - self.y0
+        return np.stack([
+            np.bincount(flat, weights=weights, minlength=rows * cols).reshape(rows, cols)
+            for weights in (np.ones_like(dx), dx, dy, dx * dy, dx * dx, dy * dy)
+        ])
+
+    def _accumulate(self):
+        rows, cols = self.grids.shape[1:]
+        self.counts = self.grids[N]
+        self.table = np.zeros((6, rows + 1, cols + 1))
+        self.table[:, 1:, 1:] = self.grids.cumsum(axis=1).cumsum(axis=2)
+
+    def extend(self, catalog, start):
+        # Catalog rows appended from start on, for Catalog.inherit. The new
+        # events are binned around the existing means and the grid grows to
+        # cover them; only the prefix sums over the grid are recomputed.
+        new = events_since(catalog, start, self.declustering)
+        mag, depth = new["MAG"].to_numpy(np.float64), new["DEPTH"].to_numpy(np.float64)
+        table = copy.copy(self)
+        if not len(mag):
+            return table
+
+        mag_bin, depth_bin = _bins(mag, depth)
+        rows, cols = self.grids.shape[1:]
+        table.mag_origin = min(self.mag_origin, mag_bin.min())
+        table.depth_origin = min(self.depth_origin, depth_bin.min())
+        shape = (
+            max(self.mag_origin + rows, mag_bin.max() + 1) - table.mag_origin,
+            max(self.depth_origin + cols, depth_bin.max() + 1) - table.depth_origin,
+        )
+        i, j = self.mag_origin - table.mag_origin, self.depth_origin - table.depth_origin
+        table.grids = table._grids(mag, depth, mag_bin, depth_bin, shape)
+        table.grids[:, i:i + rows, j:j + cols] += self.grids
+        table._accumulate()
+        return table
+
+    def _bounds(self, mag_range, depth_range):
+        # Inclusive ranges to half-open bin bounds, clipped to the table
+        rows, cols = self.counts.shape
+        i0 = np.clip(int(np.rint(mag_range[0] / MAG_STEP)) - self.mag_origin, 0, rows)
+        i1 = np.clip(int(np.rint(mag_range[1] / MAG_STEP)) - self.mag_origin + 1, 0, rows)
+        j0 = np.clip(int(np.rint(depth_range[0] / DEPTH_STEP)) - self.depth_origin, 0, cols)
+        j1 = np.clip(int(np.rint(depth_range[1] / DEPTH_STEP)) - self.depth_origin + 1, 0, cols)
+        return i0, max(i0, i1), j0, max(j0, j1)
+
+    def sums(self, mag_range, depth_range):
+        i0, i1, j0, j1 = self._bounds(mag_range, depth_range)
+        t = self.table
+        return t[:, i1, j1] - t[:, i0, j1] - t[:, i1, j0] + t[:, i0, j0]
+
+    def fit(self, mag_range, depth_range):
+        # Pearson r and the OLS line MAG = intercept + slope * DEPTH
+        s = self.sums(mag_range, depth_range)
+        n = s[N]
+        if n < 2:
+            return int(n), np.nan, np.nan, np.nan
+
+        sxx = n * s[SXX] - s[SX] ** 2
+        syy = n * s[SYY] - s[SY] ** 2
+        sxy = n * s[SXY] - s[SX] * s[SY]
+        # A constant variable leaves only rounding noise in its variance
+        varies_x = sxx > 1e-12 * n * s[SXX]
+        varies_y = syy > 1e-12 * n * s[SYY]
+        r = sxy / np.sqrt(sxx * syy) if varies_x and varies_y else np.nan
+        slope = sxy / sxx if varies_x else np.nan
+        intercept = self.y0 + s[SY] / n - slope * (self.x0 + s[SX] / n)
+        return int(round(n)), r, slope, intercept
+
+    def density(self, mag_range, depth_range, depth_bins=100):
+        # Event counts over the rectangle, with depth merged into at most
+        # depth_bins columns, as (counts, magnitudes, depth column starts)
+        i0, i1, j0, j1 = self._bounds(mag_range, depth_range)
+        counts = self.counts[i0:i1, j0:j1]
+        step = max(1, -(-counts.shape[1] // depth_bins))
+        starts = np.arange(0, counts.shape[1], step)
+        if counts.size:
+            counts = np.add.reduceat(counts, starts, axis=1)
+        magnitudes = (np.arange(i0, i1) + self.mag_origin) * MAG_STEP
+        depths = (starts + j0 + self.depth_origin) * DEPTH_STEP
+        return counts, magnitudes.round(1), depths.round(1)
+
+
+def prefix_table(catalog, declustering=None):
+    # Same cleaned events as the statistics page
+    return catalog.derived(("prefix_table", declustering), lambda catalog: persist.get_or_build(
+        "prefix_table", (catalog.digest, declustering),
+        lambda: PrefixTable(*events(catalog, declustering)[["MAG", "DEPTH"]].to_numpy().T, declustering)))
@@ -0,0 +1,159 @@
+import numpy as np
+import pandas as pd
+
+import persist
+from decluster import declustered
+
+DIMENSIONS = ["YEAR", "MONTH", "WEEKDAY", "MAG_BIN", "DEPTH_BIN"]
+
+# Magnitudes are reported to 0.1, so MAG_BIN = round(MAG * 10) is exact
+MAG_STEP = 0.1
+DEPTH_EDGES = np.array([0, 5, 10, 20, 35, 70, 150, 300, np.inf])
+
+# How each measure combines when cells are merged
+MEASURES = {
+    "COUNT": "sum",
+    "MAG_SUM": "sum",
+    "MAG_SQ": "sum",
+    "DEPTH_SUM": "sum",
+    "MAG_MIN": "min",
+    "MAG_MAX": "max",
+    "DEPTH_MIN": "min",
+    "DEPTH_MAX": "max",
+}
+
+TOP_EVENTS = 5
+
+# Events the statistics page has always counted
+CLEAN = {"dropna": ["DATE"], "positive": ["MAG", "DEPTH"]}
+
+
+def _cells(frame):
+    # One row per event, keyed by its cube coordinates, then rolled up into
+    # the non-empty cells only
+    datetime = frame["DATE"].to_numpy("datetime64[ns]")
+    days = datetime.astype("datetime64[D]").astype(np.int64)
+    mag = frame["MAG"].to_numpy(np.float64)
+    depth = frame["DEPTH"].to_numpy(np.float64)
+
+    events = pd.DataFrame({
+        "YEAR": datetime.astype("datetime64[Y]").astype(np.int64) + 1970,
+        "MONTH": datetime.astype("datetime64[M]").astype(np.int64) % 12 + 1,
+        # 1970-01-01 was a Thursday; 0 is Monday as in pandas
+        "WEEKDAY": (days + 3) % 7,
+        "MAG_BIN": np.rint(mag / MAG_STEP).astype(np.int64),
+        "DEPTH_BIN": np.searchsorted(DEPTH_EDGES, depth, side="right") - 1,
+        "COUNT": 1,
+        "MAG_SUM": mag,
+        "MAG_SQ": mag ** 2,
+        "DEPTH_SUM": depth,
+        "MAG_MIN": mag,
+        "MAG_MAX": mag,
+        "DEPTH_MIN": depth,
+        "DEPTH_MAX": depth,
+    })
+    return events.groupby(DIMENSIONS).agg(MEASURES)
+
+
+def _largest(frame):
+    largest = frame[["DATE", "LAT", "LON", "MAG"]].nlargest(TOP_EVENTS, "MAG", keep="first")
+    # Back to the catalog's own decimal precision for display
+    return largest.astype({"LAT": np.float64, "LON": np.float64, "MAG": np.float64}).round({"LAT": 4, "LON": 4, "MAG": 1})
+
+
+def events(catalog, declustering=None):
+    # The cleaned events, or only the mainshocks among them
+    frame = catalog.view(**CLEAN)
+    if declustering is not None:
+        frame = frame[declustered(catalog, declustering).mainshock[frame.index]]
+    return frame
+
+
+def events_since(catalog, start, declustering=None):
+    frame = catalog.view_since(start, **CLEAN)
+    if declustering is not None:
+        frame = frame[declustered(catalog, declustering).mainshock[frame.index]]
+    return frame
+
+
+class Cube:
+    # Materialised year x month x weekday x magnitude bin x depth bin
+    # aggregates. Every statistic on the dashboard is read from a marginal of
+    # the cube, which is computed once and then looked up.
+    def __init__(self, cells, largest, declustering=None):
+        self.cells = cells
+        self.largest = largest
+        self.declustering = declustering
+        self._marginals = {}
+
+    @classmethod
+    def build(cls, frame, declustering=None):
+        return cls(_cells(frame), _largest(frame), declustering)
+
+    def update(self, frame):
+        # New cube with the events of frame added; only the new events are binned
+        cells = pd.concat([self.cells, _cells(frame)]).groupby(level=DIMENSIONS).agg(MEASURES)
+        largest = _largest(pd.concat([self.largest, frame[self.largest.columns]]))
+        return Cube(cells, largest, self.declustering)
+
+    def extend(self, catalog, start):
+        # Catalog rows appended from start on, for Catalog.inherit
+        return self.update(events_since(catalog, start, self.declustering))
+
+    def marginal(self, *dims):
+        if dims not in self._marginals:
+            if dims:
+                self._marginals[dims] = self.cells.groupby(level=list(dims)).agg(MEASURES)
+            else:
+                self._marginals[dims] = self.cells.agg(MEASURES)
+        return self._marginals[dims]
+
+    def years(self):
+        return self.marginal("YEAR").index.tolist()
+
+    def counts(self, *dims, **where):
+        # Event counts along dims, optionally restricted e.g. YEAR=2010
+        table = self.marginal(*where, *dims)["COUNT"]
+        if where:
+            table = table.xs(tuple(where.values()), level=list(where))
+        return table
+
+    def magnitude_histogram(self):
+        # A relabelled copy; the marginal itself is cached and shared
+        counts = self.counts("MAG_BIN")
+        return counts.set_axis((counts.index * MAG_STEP).round(1).rename("MAG"))
+
+    def summary(self):
+        total = self.marginal()
+        n = total["COUNT"]
+        histogram = self.magnitude_histogram()
+
+        # Median from the exact histogram: average of the two middle values
+        cumulative = histogram.cumsum().to_numpy()
+        lower = histogram.index[np.searchsorted(cumulative, (n - 1) // 2, side="right")]
+        upper = histogram.index[np.searchsorted(cumulative, n // 2, side="right")]
+
+        return {
+            "Total Earthquakes": int(n),
+            "Minimum Magnitude": total["MAG_MIN"],
+            "Maximum Magnitude": total["MAG_MAX"],
+            "Median Magnitude": (lower + upper) / 2,
+            "Mean Magnitude": total["MAG_SUM"] / n,
+            "Standard Deviation (Magnitude)": np.sqrt((total["MAG_SQ"] - total["MAG_SUM"] ** 2 / n) / (n - 1)),
+            "Mode Magnitude": histogram.idxmax() if n else None,
+            "Average Depth (km)": total["DEPTH_SUM"] / n,
+            "Shallowest Earthquake (km)": total["DEPTH_MIN"],
+            "Deepest Earthquake (km)": total["DEPTH_MAX"],
+        }
+
+    def mean_magnitude(self, *dims):
+        table = self.marginal(*dims)
+        return table["MAG_SUM"] / table["COUNT"]
+
+
+def cube(catalog, declustering=None):
+    # Built from the same cleaned events the statistics page has always used,
+    # or read back from the disk cache when this catalog content was seen before
+    return catalog.derived(("cube", declustering), lambda catalog: persist.get_or_build(
+        "cube", (catalog.digest, declustering),
+        lambda: Cube.build(events(catalog, declustering), declustering)))
@@ -0,0 +1,163 @@
+import numpy as np
+
+import persist
+from spatial import KM_PER_DEGREE, haversine
+
+NS_PER_DAY = 86400 * 10**9
+
+# Pairs checked for distance at a time, to bound memory on dense catalogs
+PAIR_CHUNK = 2**22
+
+
+# Aftershock windows: distance in km and duration in days after a mainshock
+# of magnitude mag
+def gardner_knopoff(mag):
+    distance = 10 ** (0.1238 * mag + 0.983)
+    days = np.where(mag >= 6.5, 10 ** (0.032 * mag + 2.7389), 10 ** (0.5409 * mag - 0.547))
+    return distance, days
+
+
+def uhrhammer(mag):
+    return np.exp(-1.024 + 0.804 * mag), np.exp(-2.87 + 1.235 * mag)
+
+
+WINDOWS = {
+    "Gardner-Knopoff": gardner_knopoff,
+    "Uhrhammer": uhrhammer,
+}
+
+
+def _ranges(lo, hi):
+    # Concatenated aranges lo[k]..hi[k] and the k each value came from
+    lengths = hi - lo
+    owner = np.repeat(np.arange(len(lo)), lengths)
+    offsets = np.cumsum(lengths) - lengths
+    return lo[owner] + np.arange(lengths.sum()) - offsets[owner], owner
+
+
+def _links(lat, lon, epoch, distance, duration):
+    # (source, target) pairs of events where the target follows the source
+    # within its time and distance window. Events are bucketed on a grid at
+    # least as coarse as the windows, so each source only looks at the nine
+    # cells around it and, inside each, at the time-ordered run that falls in
+    # its window: two binary searches per cell instead of a scan.
+    n = len(lat)
+    end = np.searchsorted(epoch, epoch + duration, side="right")
+    # Window radii grow with magnitude; sources share a grid per doubling
+    smallest = max(float(distance.min()), 1.0) if n else 1.0
+    scale = np.maximum(np.ceil(np.log2(distance / smallest)), 0).astype(np.int64)
+    stretch = 1 / max(np.cos(np.radians(min(float(np.abs(lat).max()), 85.0))), 1e-6) if n else 1.0
+
+    sources, targets = [], []
+    position = np.arange(n)
+    for k in np.unique(scale):
+        cell = smallest * 2.0 ** k / KM_PER_DEGREE
+        row = np.floor(lat / cell).astype(np.int64)
+        column = np.floor(lon / (cell * stretch)).astype(np.int64)
+        row, column = row - row.min() + 1, column - column.min() + 1
+        width = column.max() + 2
+        codes, code_of = np.unique(row * width + column, return_inverse=True)
+        # Events ordered by cell, then time; key = cell rank * n + position
+        keys = np.sort(code_of * n + position)
+
+        # Sources in cell order, so that the searches below get sorted
+        # needles and numpy can resume each from the previous one
+        mine = np.flatnonzero(scale == k)
+        mine = mine[np.argsort(code_of[mine] * n + mine)]
+        for dy in (-1, 0, 1):
+            for dx in (-1, 0, 1):
+                neighbour = (row[mine] + dy) * width + column[mine] + dx
+                rank = np.minimum(np.searchsorted(codes, neighbour), len(codes) - 1)
+                present = codes[rank] == neighbour
+                source = mine[present]
+                lo = np.searchsorted(keys, rank[present] * n + source + 1)
+                hi = np.searchsorted(keys, rank[present] * n + end[source])
+                busy = hi > lo
+                source, lo, hi = source[busy], lo[busy], hi[busy]
+
+                # Distance checks in chunks of sources
+                bounds = np.searchsorted(np.cumsum(hi - lo), np.arange(0, (hi - lo).sum(), PAIR_CHUNK), side="right")
+                for a, b in zip(bounds, list(bounds[1:]) + [len(source)]):
+                    found, owner = _ranges(lo[a:b], hi[a:b])
+                    s, t = source[a:b][owner], keys[found] % n
+                    near = haversine(lat[t], lon[t], lat[s], lon[s]) <= distance[s]
+                    sources.append(s[near])
+                    targets.append(t[near])
+
+    if not sources:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    return np.concatenate(sources), np.concatenate(targets)
+
+
+def decluster(lat, lon, epoch, mag, windows=gardner_knopoff):
+    # Window declustering (Gardner & Knopoff, 1974) of chronologically sorted
+    # events. From the largest event down, every event not yet taken becomes
+    # a mainshock and takes the untaken later events inside its window as its
+    # aftershocks. Returns each event's cluster (the position of its
+    # mainshock, or its own) and whether it is a mainshock.
+    n = len(lat)
+    lat, lon, mag = (np.asarray(values, dtype=np.float64) for values in (lat, lon, mag))
+    distance, days = windows(mag)
+    source, target = _links(lat, lon, epoch, distance, (days * NS_PER_DAY).astype(np.int64))
+
+    # Processing order: magnitude descending, earlier first on ties. An event
+    # processed before its source is already fixed and cannot be taken.
+    order = np.lexsort((np.arange(n), -mag))
+    rank = np.empty(n, dtype=np.int64)
+    rank[order] = np.arange(n)
+    later = rank[target] > rank[source]
+    source, target = source[later], target[later]
+
+    by_rank = np.argsort(rank[source], kind="stable")
+    source, target = source[by_rank], target[by_rank]
+    starts = np.flatnonzero(np.r_[True, source[1:] != source[:-1]]) if len(source) else np.empty(0, dtype=np.int64)
+    stops = np.r_[starts[1:], len(source)].astype(np.int64)
+
+    cluster = np.arange(n)
+    taken = np.zeros(n, dtype=bool)
+    # Sequential only over events that have any later event in their window
+    for start, stop in zip(starts.tolist(), stops.tolist()):
+        mainshock = source[start]
+        if taken[mainshock]:
+            continue
+        window = target[start:stop]
+        window = window[~taken[window]]
+        cluster[window] = mainshock
+        taken[window] = True
+    return cluster, ~taken
+
+
+class Declustering:
+    # Cluster and mainshock flag of every catalog row. Events without a
+    # date, location or positive magnitude cannot be placed in a window and
+    # count as mainshocks.
+    def __init__(self, catalog, method):
+        self.method = method
+        columns = catalog.columns
+        epoch, lat, lon, mag = columns["EPOCH"], columns["LAT"], columns["LON"], columns["MAG"]
+        usable = np.flatnonzero(
+            (epoch != np.iinfo(np.int64).min) & ~np.isnan(lat) & ~np.isnan(lon) & (mag > 0)
+        )
+
+        self.cluster = np.arange(len(catalog))
+        self.mainshock = np.ones(len(catalog), dtype=bool)
+        cluster, mainshock = decluster(lat[usable], lon[usable], epoch[usable], mag[usable], WINDOWS[method])
+        self.cluster[usable] = usable[cluster]
+        self.mainshock[usable] = mainshock
+
+    def extend(self, catalog, start):
+        # Windows only reach forward in time, so the rows before start keep
+        # their flags; structures filtered by them can be extended as well.
+        # The flags themselves are recomputed.
+        return _build(catalog, self.method)
+
+    def mainshocks(self):
+        return np.flatnonzero(self.mainshock)
+
+
+def _build(catalog, method):
+    return persist.get_or_build("declustering", (catalog.digest, method), lambda: Declustering(catalog, method))
+
+
+def declustered(catalog, method="Gardner-Knopoff"):
+    return catalog.derived(("declustering", method), lambda catalog: _build(catalog, method))
@@ -1,30 +1,71 @@
 import streamlit as st
-import pandas as pd
 import numpy as np
-import plotly.express as px
+from catalog import load_catalog
+from correlation import prefix_table
+from cube import cube
+from perf import span
+from sidebar import selection_declustering
+from sketches import streaming_summary
+
+def build_correlation_figure(table, mag_range, depth_range):
+    import plotly.graph_objects as go
+
+    counts, magnitudes, depths = table.density(mag_range, depth_range)
+    fig = go.Figure(go.Heatmap(
+        x=depths,
+        y=magnitudes,
+        z=np.where(counts > 0, counts, np.nan),
+        colorscale="Blues",
+        colorbar=dict(title="Earthquakes"),
+        hovertemplate="Depth: %{x} km<br>Magnitude: %{y}<br>Earthquakes: %{z}<extra></extra>",
+    ))
+    count, correlation, slope, intercept = table.fit(mag_range, depth_range)
+    if count > 1 and not np.isnan(slope):
+        fig.add_trace(go.Scatter(
+            x=list(depth_range),
+            y=[intercept + slope * depth for depth in depth_range],
+            mode="lines",
+            line=dict(color="red"),
+            name=f"OLS: MAG = {intercept:.3f} + {slope:.4f} × DEPTH",
+        ))
+    fig.update_layout(
+        title="Filtered Depth vs Magnitude",
+        xaxis_title="Depth (km)",
+        yaxis_title="Magnitude",
+        legend=dict(orientation="h", y=-0.2),
+    )
+    return fig
+
+# Builds the cube marginals and the correlation figure the page opens with
+def warm_up(catalog):
+    stats = cube(catalog)
+    summary = stats.summary()
+    stats.counts("YEAR")
+    stats.mean_magnitude("YEAR")
+    stats.marginal("YEAR", "WEEKDAY")
+    stats.marginal("YEAR", "MONTH")
+    mag_range = (round(float(summary["Minimum Magnitude"]), 1), round(float(summary["Maximum Magnitude"]), 1))
+    depth_range = (int(summary["Shallowest Earthquake (km)"]), int(summary["Deepest Earthquake (km)"]))
+    build_correlation_figure(prefix_table(catalog), mag_range, depth_range)
 
 def run():
     st.title("🌍 Earthquake Statistics Dashboard")
-    data = pd.read_csv("dataOUT/earthquakes.csv")
-    
-    data.columns = data.columns.str.strip()
-    data['DATE'] = pd.to_datetime(data['DATE'], errors='coerce')
-    data = data.dropna(subset=['DATE'])
-    data = data[(data['MAG'] > 0) & (data['DEPTH'] > 0)]
-
-
-    basic_stats = {
-        "Total Earthquakes": len(data),
-        "Minimum Magnitude": data['MAG'].min(),
-        "Maximum Magnitude": data['MAG'].max(),
-        "Median Magnitude": data['MAG'].median(),
-        "Mean Magnitude": data['MAG'].mean(),
-        "Standard Deviation (Magnitude)": data['MAG'].std(),
-        "Mode Magnitude": data['MAG'].mode()[0] if not data['MAG'].mode().empty else None,
-        "Average Depth (km)": data['DEPTH'].mean(),
-        "Shallowest Earthquake (km)": data['DEPTH'].min(),
-        "Deepest Earthquake (km)": data['DEPTH'].max()
-    }
+    with span("load"):
+        catalog = load_catalog()
+
+    # The map pages' "Mainshocks Only" filter applies here too
+    declustering = selection_declustering()
+    if declustering is not None:
+        st.caption(f"Mainshocks only: aftershocks within {declustering} windows are left out.")
+
+    # Catalogs too large for the cube are summarised chunk by chunk with
+    # mergeable sketches instead; the median becomes approximate
+    out_of_core = st.toggle("Out-of-Core Mode", help="Stream the catalog in chunks with bounded memory; the median is estimated by a quantile sketch.")
+
+    # Every table and chart below is sliced from the per-catalog cube
+    with span("aggregate"):
+        stats = streaming_summary(catalog, declustering) if out_of_core else cube(catalog, declustering)
+        basic_stats = stats.summary()
 
     st.subheader("📌 Summary Statistics")
     for stat, value in basic_stats.items():
@@ -34,7 +75,8 @@ def run():
 
     # Earthquakes per Year
     st.subheader("📅 Earthquakes Per Year")
-    earthquakes_per_year = data.groupby(data['DATE'].dt.year).size().reset_index(name='Earthquake Count')
+    earthquakes_by_year = stats.counts("YEAR")
+    earthquakes_per_year = earthquakes_by_year.rename_axis('DATE').reset_index(name='Earthquake Count')
     
     # Sorting Option
     sort_option = st.selectbox(
@@ -52,64 +94,42 @@ def run():
     st.markdown("---")
 
     st.subheader("⚡ Top 5 Largest Earthquakes")
-    top_earthquakes = data[['DATE', 'LAT', 'LON', 'MAG']].sort_values(by='MAG', ascending=False).head(5)
-    st.write(top_earthquakes)
+    st.write(stats.largest)
 
     st.markdown("---")
 
     # Earthquakes Over Time Chart
     st.markdown('<h2 style="font-size:40px; color: #2d3e50;">🌍 Earthquakes Over Time</h2>', unsafe_allow_html=True)
-    earthquakes_by_year = data.groupby(data['DATE'].dt.year).size()  
     st.line_chart(earthquakes_by_year)
 
     st.markdown("---")
 
     # Magnitude Distribution Chart
     st.subheader("📊 Magnitude Distribution")
-    st.bar_chart(data['MAG'].value_counts().sort_index())
+    st.bar_chart(stats.magnitude_histogram())
 
     st.markdown("---")
 
-    # Earthquakes by Month
-    data['Month'] = data['DATE'].dt.month
-    monthly_counts = data['Month'].value_counts().sort_index()
-
     # Earthquakes by Day of Week
-    available_years = data['DATE'].dt.year.dropna().unique()
-    selected_year = st.selectbox("Select Year for Day of the Week Analysis", sorted(available_years))
+    available_years = stats.years()
+    selected_year = st.selectbox("Select Year for Day of the Week Analysis", available_years)
    
-    yearly_data = data[data['DATE'].dt.year == selected_year]
-    yearly_data['Weekday'] = yearly_data['DATE'].dt.day_name()
-    
-    weekday_counts = yearly_data['Weekday'].value_counts()
     weekday_order = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
-    weekday_counts = weekday_counts.reindex(weekday_order).fillna(0)
+    weekday_counts = stats.counts("WEEKDAY", YEAR=selected_year)
+    weekday_counts = weekday_counts.reindex(range(7)).fillna(0)
+    weekday_counts.index = weekday_order
 
     st.subheader(f"📅 Earthquakes by Day of the Week in {selected_year}")
     st.bar_chart(weekday_counts)
 
-
-    # Cumulative Earthquake Count Over Time
-    data['Year'] = data['DATE'].dt.year
-    cumulative_data = data.groupby('Year').size().cumsum()
-
-    # Average Magnitude per Year
-    avg_mag_per_year = data.groupby('Year')['MAG'].mean()
-
-    # Depth vs Magnitude Correlation
-    correlation = data['DEPTH'].corr(data['MAG'])
-
     st.markdown("---")
 
     # Earthquakes by Month (with year selection)
     st.subheader("🗓️ Earthquakes by Month")
     
-    available_years = data['DATE'].dt.year.dropna().unique()
-    selected_year_month = st.selectbox("Select Year for Monthly Analysis", sorted(available_years))
+    selected_year_month = st.selectbox("Select Year for Monthly Analysis", available_years)
     
-    yearly_month_data = data[data['DATE'].dt.year == selected_year_month]
-    yearly_month_data['Month'] = yearly_month_data['DATE'].dt.month
-    monthly_counts = yearly_month_data['Month'].value_counts().sort_index()
+    monthly_counts = stats.counts("MONTH", YEAR=selected_year_month)
     
     month_names = {
         1: "January", 2: "February", 3: "March", 4: "April",
@@ -124,17 +144,20 @@ def run():
 
     # Average Magnitude per Year
     st.subheader("📊 Average Magnitude per Year")
-    st.line_chart(avg_mag_per_year)
+    st.line_chart(stats.mean_magnitude("YEAR"))
 
     st.markdown("---")
 
     # Depth vs Magnitude Correlation
     st.subheader("🔗 Depth vs Magnitude Correlation")
+    if out_of_core:
+        st.info("The correlation is read from an in-memory prefix table; turn off Out-of-Core Mode to explore it.")
+        return
 
-    min_mag_val = float(data['MAG'].min())
-    max_mag_val = float(data['MAG'].max())
-    min_depth_val = float(data['DEPTH'].min())
-    max_depth_val = float(data['DEPTH'].max())
+    min_mag_val = float(basic_stats["Minimum Magnitude"])
+    max_mag_val = float(basic_stats["Maximum Magnitude"])
+    min_depth_val = float(basic_stats["Shallowest Earthquake (km)"])
+    max_depth_val = float(basic_stats["Deepest Earthquake (km)"])
 
     mag_range = st.slider(
         "Select Magnitude Range:",
@@ -152,15 +175,14 @@ def run():
         step=10
     )
 
-    filtered_corr_data = data[
-        (data['MAG'] >= mag_range[0]) & (data['MAG'] <= mag_range[1]) &
-        (data['DEPTH'] >= depth_range[0]) & (data['DEPTH'] <= depth_range[1])
-    ]
+    # Constant-time lookup in the per-catalog prefix-sum table
+    with span("correlation"):
+        table = prefix_table(catalog, declustering)
+        count, correlation, slope, intercept = table.fit(mag_range, depth_range)
 
-    if filtered_corr_data.empty:
+    if count == 0:
         st.warning("No data available for the selected filters.")
     else:
-        correlation = filtered_corr_data['DEPTH'].corr(filtered_corr_data['MAG'])
         st.write(f"**Filtered Pearson Correlation Coefficient:** {round(correlation, 3)}")
 
     col1, col2, col3, col4 = st.columns(4)
@@ -217,17 +239,11 @@ def run():
                 **Interpretation:** A moderate negative relationship. As one variable increases, the other decreases in a somewhat linear fashion.
             """)
 
-    # Scatter plot with trendline
-    fig = px.scatter(
-        filtered_corr_data,
-        x="DEPTH",
-        y="MAG",
-        labels={"DEPTH": "Depth (km)", "MAG": "Magnitude"},
-        title="Filtered Depth vs Magnitude",
-        trendline="ols",
-        opacity=0.7
-        )
-    st.plotly_chart(fig, use_container_width=True)
+    # Density of events with the OLS trendline, instead of one marker per event
+    with span("figure"):
+        fig = build_correlation_figure(table, mag_range, depth_range)
+    with span("render", payload=fig.to_json):
+        st.plotly_chart(fig, use_container_width=True)
 
     st.markdown("---")
 
@@ -0,0 +1,250 @@
+import argparse
+import hashlib
+import inspect
+import json
+import os
+import re
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import streamlit as st
+from streamlit import config
+
+# Bare-mode cache warnings are expected here; the page modules below log one
+# for every cached function as they are imported
+config.set_option("logger.level", "error")
+st.logger.set_log_level("error")
+
+import animatedMap
+import descriptiveStat
+import flowMap
+import heatMap
+import spikeMap
+from aggregate import pyramid
+from catalog import CSV_PATH, read_catalog
+from correlation import PrefixTable
+from cube import Cube
+from filters import filter_index, select
+from persist import source_hash
+from spatial import PRESETS, spatial_index
+
+# Headless snapshots of the dashboard's views for a grid of regions and
+# magnitude thresholds, built by the pages' own figure functions and written
+# as standalone HTML (and JSON for the statistics):
+#
+#   python export.py --regions Everywhere "Vrancea zone" --min-mags 3 4
+#
+# Every artifact is recorded in the output's manifest with a key of the
+# catalog content, its parameters and the source of the code drawing it; a
+# later run skips the artifacts whose key is unchanged.
+VIEWS = ["spikeMap", "heatMap", "flowMap", "animatedMap", "descriptiveStat"]
+MODULES = {
+    "spikeMap": spikeMap,
+    "heatMap": heatMap,
+    "flowMap": flowMap,
+    "animatedMap": animatedMap,
+    "descriptiveStat": descriptiveStat,
+}
+
+# Views also drawn once per year of the catalog; the animation runs over the
+# years itself and ignores the magnitude threshold, as on its page
+PER_YEAR = {"spikeMap", "heatMap", "flowMap"}
+UNFILTERED = {"animatedMap"}
+
+EVERYWHERE = "Everywhere"
+REGIONS = [EVERYWHERE, *PRESETS]
+MIN_MAGS = [3.0, 4.0]
+OUTPUT_DIR = "dataOUT/export"
+MANIFEST = "manifest.json"
+
+# The catalog of a worker process, opened once by _open_catalog
+_catalog = None
+
+
+def _slug(text):
+    return re.sub(r"[^a-z0-9]+", "-", text.lower()).strip("-")
+
+
+def name(task):
+    # Artifact path without extension, e.g. spikeMap/vrancea-zone/m4/2010
+    view, region, min_mag, year = task
+    parts = [view, _slug(region)]
+    if min_mag is not None:
+        parts.append(f"m{min_mag:g}")
+    parts.append("all" if year is None else str(year))
+    return "/".join(parts)
+
+
+def tasks(catalog, views, regions, min_mags, per_year=True):
+    years = filter_index(catalog).years.tolist()
+    for view in views:
+        for region in regions:
+            if view in UNFILTERED:
+                yield view, region, None, None
+                continue
+            for min_mag in min_mags:
+                yield view, region, min_mag, None
+                if per_year and view in PER_YEAR:
+                    for year in years:
+                        yield view, region, min_mag, year
+
+
+def task_key(catalog, task, offline):
+    # Changes with the catalog content, the parameters and the code of the
+    # view, the repo's modules it depends on and this one
+    own = hashlib.sha256(inspect.getsource(sys.modules[__name__]).encode()).hexdigest()[:16]
+    sources = (source_hash(MODULES[task[0]]), own)
+    return hashlib.sha256(repr((catalog.digest, task, offline, sources)).encode()).hexdigest()[:32]
+
+
+def load_manifest(output):
+    try:
+        with open(os.path.join(output, MANIFEST)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_manifest(output, manifest):
+    # Replaced atomically, so an interrupted run keeps the entries written so far
+    fd, tmp = tempfile.mkstemp(dir=output, prefix=".tmp-")
+    with os.fdopen(fd, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp, os.path.join(output, MANIFEST))
+
+
+def _open_catalog(path):
+    # Forked workers inherit the parent's catalog with the indexes it built;
+    # spawned ones memory-map the binary columns the parent wrote
+    global _catalog
+    _catalog = read_catalog(path)
+
+
+def _json_value(value):
+    # numpy scalars as Python ones, float32 values at the catalog's precision
+    value = value.item() if isinstance(value, np.generic) else value
+    return round(value, 4) if isinstance(value, float) else value
+
+
+def _statistics(catalog, rows):
+    # The statistics page's tables, from a cube of the selected events
+    data = catalog.take(rows)
+    stats = Cube.build(data)
+    summary = {stat: _json_value(value) for stat, value in stats.summary().items()}
+    largest = stats.largest.assign(DATE=stats.largest["DATE"].astype(str))
+    report = {
+        "summary": summary,
+        "per_year": {str(year): int(count) for year, count in stats.counts("YEAR").items()},
+        "per_month": {f"{year}-{month:02d}": int(count) for (year, month), count in stats.counts("YEAR", "MONTH").items()},
+        "magnitude_histogram": {f"{mag:.1f}": int(count) for mag, count in stats.magnitude_histogram().items()},
+        "largest": largest.to_dict(orient="records"),
+    }
+    table = PrefixTable(data["MAG"].to_numpy(), data["DEPTH"].to_numpy())
+    mag_range = (round(float(summary["Minimum Magnitude"]), 1), round(float(summary["Maximum Magnitude"]), 1))
+    depth_range = (int(summary["Shallowest Earthquake (km)"]), int(summary["Deepest Earthquake (km)"]))
+    return report, descriptiveStat.build_correlation_figure(table, mag_range, depth_range)
+
+
+def render(task, output, offline=False):
+    # Writes the artifacts of one task and returns their paths relative to
+    # output; none when the selection is empty. The figure functions are
+    # called beneath their Streamlit caches, on the disk cache the app shares.
+    view, region, min_mag, year = task
+    catalog = _catalog
+    area = PRESETS.get(region)
+    base = os.path.join(output, name(task))
+    os.makedirs(os.path.dirname(base), exist_ok=True)
+    plotlyjs = True if offline else "cdn"
+
+    if view in UNFILTERED:
+        fig = animatedMap.build_figure.__wrapped__(catalog, catalog.digest, animatedMap.BUCKETS[0], 500, False, area, None)
+        fig.write_html(base + ".html", include_plotlyjs=plotlyjs)
+        return [name(task) + ".html"]
+
+    filters = (min_mag, year, year, None, area)
+    rows = select(catalog, *filters)
+    key = (catalog.digest, filters)
+    if not len(rows):
+        return []
+
+    if view == "spikeMap":
+        cells, size = spikeMap.build_cells.__wrapped__(catalog, rows, key)
+        spikeMap.build_deck(cells, size).to_html(base + ".html", open_browser=False, notebook_display=False, offline=offline)
+    elif view == "heatMap":
+        heat, markers = heatMap.build_layers.__wrapped__(catalog, catalog.take(rows), key)
+        heatMap.build_map(heat, markers).save(base + ".html")
+    elif view == "flowMap":
+        if len(rows) < 2:
+            return []
+        fig = flowMap.build_figure.__wrapped__(catalog.take(rows).reset_index(drop=True), key, flowMap.MAX_FRAMES)
+        fig.write_html(base + ".html", include_plotlyjs=plotlyjs)
+    else:
+        report, fig = _statistics(catalog, rows)
+        with open(base + ".json", "w") as f:
+            json.dump(report, f, indent=2, default=_json_value)
+        fig.write_html(base + ".html", include_plotlyjs=plotlyjs)
+        return [name(task) + ".json", name(task) + ".html"]
+    return [name(task) + ".html"]
+
+
+def export(path, output, views, regions, min_mags, per_year=True, workers=None, offline=False, force=False):
+    # Parses the catalog once; the indexes every task needs are built here,
+    # before the workers start, so that forked workers share them
+    catalog = read_catalog(path)
+    filter_index(catalog)
+    pyramid(catalog)
+    if set(regions) - {EVERYWHERE}:
+        spatial_index(catalog)
+
+    os.makedirs(output, exist_ok=True)
+    manifest = load_manifest(output)
+    pending, skipped = [], 0
+    for task in tasks(catalog, views, regions, min_mags, per_year):
+        key = task_key(catalog, task, offline)
+        entry = manifest.get(name(task))
+        if not force and entry and entry["key"] == key and all(os.path.exists(os.path.join(output, file)) for file in entry["files"]):
+            skipped += 1
+        else:
+            pending.append((task, key))
+
+    failed = 0
+    with ProcessPoolExecutor(max_workers=workers, initializer=_open_catalog, initargs=(path,)) as pool:
+        futures = {pool.submit(render, task, output, offline): (task, key) for task, key in pending}
+        for future in as_completed(futures):
+            task, key = futures[future]
+            try:
+                files = future.result()
+            except Exception as e:
+                failed += 1
+                print(f"{name(task)}: failed: {e!r}", file=sys.stderr)
+                continue
+            manifest[name(task)] = {"key": key, "files": files}
+            save_manifest(output, manifest)
+            print(f"{name(task)}: {', '.join(files) if files else 'no events'}")
+
+    print(f"\n{len(pending) - failed} rendered, {skipped} unchanged, {failed} failed; manifest in {os.path.join(output, MANIFEST)}")
+    return failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render the dashboard's views for a grid of regions and magnitude thresholds.")
+    parser.add_argument("--catalog", default=CSV_PATH, help="catalog CSV file")
+    parser.add_argument("--output", default=OUTPUT_DIR, help="directory for the artifacts and the manifest")
+    parser.add_argument("--views", nargs="+", choices=VIEWS, default=VIEWS)
+    parser.add_argument("--regions", nargs="+", choices=REGIONS, default=REGIONS)
+    parser.add_argument("--min-mags", type=float, nargs="+", default=MIN_MAGS, help="minimum magnitudes, one artifact set each")
+    parser.add_argument("--no-per-year", dest="per_year", action="store_false", help="only whole-catalog views, no yearly ones")
+    parser.add_argument("--workers", type=int, help="worker processes (default: one per CPU)")
+    parser.add_argument("--offline", action="store_true", help="embed the JavaScript libraries instead of loading them from a CDN")
+    parser.add_argument("--force", action="store_true", help="render every artifact, changed or not")
+    args = parser.parse_args()
+
+    failed = export(args.catalog, args.output, args.views, args.regions, args.min_mags,
+                    args.per_year, args.workers, args.offline, args.force)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+import copy
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from decluster import declustered
+from partitions import partitions
+from spatial import spatial_index
+
+
+class FilterIndex:
+    # Sorted indexes over one catalog version. The catalog is chronological, so
+    # every year is a contiguous block of rows; inside each block the rows are
+    # kept sorted by magnitude, so a (min_mag, year range) filter is a binary
+    # search per year instead of a scan over every column.
+    def __init__(self, catalog, cache_size=32):
+        columns = catalog.columns
+        epoch, mag, depth = columns["EPOCH"], columns["MAG"], columns["DEPTH"]
+
+        # Same cleaning as the sidebar always applied: drop anomalous
+        # non-positive magnitudes/depths (NaN compares False) and undated rows
+        datetime = epoch.view("datetime64[ns]")
+        valid = (mag > 0) & (depth > 0) & ~np.isnat(datetime)
+        valid &= ~np.isnan(columns["LAT"]) & ~np.isnan(columns["LON"])
+        self.rows = np.flatnonzero(valid)
+
+        years = datetime[self.rows].astype("datetime64[Y]").astype(np.int64) + 1970
+        mag, depth = mag[self.rows], depth[self.rows]
+
+        self.years, self.year_starts = np.unique(years, return_index=True)
+        self.year_starts = np.append(self.year_starts, len(self.rows))
+
+        # Per-year blocks ordered by magnitude
+        self.by_year_mag = np.lexsort((mag, years))
+        self.year_mag = mag[self.by_year_mag]
+
+        # Global depth order for depth-range filters
+        self.by_depth = np.argsort(depth, kind="stable")
+        self.sorted_depth = depth[self.by_depth]
+
+        self.mag_min = float(mag.min()) if len(mag) else 0.0
+        self.mag_max = float(mag.max()) if len(mag) else 0.0
+
+        # Year partition statistics, to skip years that cannot match at all
+        self.partitions = partitions(catalog)
+
+        self._cache = OrderedDict()
+        self._cache_size = cache_size
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.rows)
+
+    def extend(self, catalog, start):
+        # Index of catalog, which is this index's catalog with rows appended
+        # in chronological order from start on. Only the last year's block and
+        # the new years are sorted again; the depth order is merged.
+        columns = catalog.columns
+        datetime = columns["EPOCH"][start:].view("datetime64[ns]")
+        mag, depth = columns["MAG"][start:], columns["DEPTH"][start:]
+        valid = (mag > 0) & (depth > 0) & ~np.isnat(datetime)
+        valid &= ~np.isnan(columns["LAT"][start:]) & ~np.isnan(columns["LON"][start:])
+        years = datetime[valid].astype("datetime64[Y]").astype(np.int64) + 1970
+        mag, depth = mag[valid], depth[valid]
+
+        index = copy.copy(self)
+        known = len(self.rows)
+        index.rows = np.concatenate([self.rows, start + np.flatnonzero(valid)])
+
+        first = max(len(self.years) - 1, 0)
+        block = self.year_starts[first] if len(self.years) else 0
+        tail_years = np.concatenate([np.full(known - block, self.years[-1] if len(self.years) else 0), years])
+        tail_mag = columns["MAG"][index.rows[block:]]
+        tail_unique, tail_starts = np.unique(tail_years, return_index=True)
+        index.years = np.concatenate([self.years[:first], tail_unique])
+        index.year_starts = np.concatenate([self.year_starts[:first], block + tail_starts, [len(index.rows)]])
+
+        order = np.lexsort((tail_mag, tail_years))
+        index.by_year_mag = np.concatenate([self.by_year_mag[:block], block + order])
+        index.year_mag = np.concatenate([self.year_mag[:block], tail_mag[order]])
+
+        depth_order = np.argsort(depth, kind="stable")
+        at = np.searchsorted(self.sorted_depth, depth[depth_order], side="right")
+        index.sorted_depth = np.insert(self.sorted_depth, at, depth[depth_order])
+        index.by_depth = np.insert(self.by_depth, at, known + depth_order)
+
+        if len(mag):
+            index.mag_min = float(mag.min()) if not known else min(self.mag_min, float(mag.min()))
+            index.mag_max = float(mag.max()) if not known else max(self.mag_max, float(mag.max()))
+
+        index.partitions = partitions(catalog)
+        index._cache = OrderedDict()
+        index._lock = threading.Lock()
+        return index
+
+    def query(self, min_mag=None, start_year=None, end_year=None, depth_range=None):
+        # Catalog row positions (ascending, i.e. chronological) matching the filters
+        key = (min_mag, start_year, end_year, depth_range)
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+
+        result = self.rows[self._positions(min_mag, start_year, end_year, depth_range)]
+        result.setflags(write=False)
+
+        with self._lock:
+            self._cache[key] = result
+            if len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+        return result
+
+    def _positions(self, min_mag, start_year, end_year, depth_range):
+        first = 0 if start_year is None else np.searchsorted(self.years, start_year, side="left")
+        last = len(self.years) if end_year is None else np.searchsorted(self.years, end_year, side="right")
+        blocks = np.arange(first, last)
+        if min_mag is not None or depth_range is not None:
+            # Years whose magnitude or depth range rules the filter out are skipped
+            possible = self.partitions.year[self.partitions.prune(min_mag, start_year, end_year, depth_range)]
+            blocks = blocks[np.isin(self.years[blocks], possible)]
+
+        if min_mag is None:
+            parts = [np.arange(self.year_starts[block], self.year_starts[block + 1]) for block in blocks]
+            positions = np.concatenate(parts) if parts else np.empty(0, dtype=np.int64)
+        else:
+            # Compare in the column dtype so 3.1 from the slider matches float32 3.1
+            threshold = np.float32(min_mag)
+            parts = []
+            for block in blocks:
+                start, end = self.year_starts[block], self.year_starts[block + 1]
+                cut = start + np.searchsorted(self.year_mag[start:end], threshold, side="left")
+                parts.append(self.by_year_mag[cut:end])
+            positions = np.sort(np.concatenate(parts)) if parts else np.empty(0, dtype=np.int64)
+
+        if depth_range is not None:
+            lo = np.searchsorted(self.sorted_depth, np.float32(depth_range[0]), side="left")
+            hi = np.searchsorted(self.sorted_depth, np.float32(depth_range[1]), side="right")
+            in_depth = np.sort(self.by_depth[lo:hi])
+            positions = np.intersect1d(positions, in_depth, assume_unique=True)
+        return positions
+
+
+def filter_index(catalog):
+    return catalog.derived("filter_index", FilterIndex)
+
+
+def select(catalog, min_mag=None, start_year=None, end_year=None, depth_range=None, region=None, declustering=None):
+    # Rows kept by a sidebar filter tuple. A region is answered by the spatial
+    # index and intersected with the magnitude/year/depth result; declustering
+    # names the aftershock windows whose mainshocks alone are kept.
+    rows = filter_index(catalog).query(min_mag, start_year, end_year, depth_range)
+    if region is not None:
+        rows = np.intersect1d(rows, spatial_index(catalog).within(region), assume_unique=True)
+    if declustering is not None:
+        rows = rows[declustered(catalog, declustering).mainshock[rows]]
+    return rows
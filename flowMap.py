@@ -1,87 +1,65 @@
 import streamlit as st
-import pandas as pd
-import plotly.graph_objects as go
-from sidebar import sidebar 
-
-@st.cache_data
-def load_data():
-    data = pd.read_csv("dataOUT/earthquakes.csv")
-    data.columns = data.columns.str.strip()
-
-    data['DATE'] = pd.to_datetime(data['DATE'], errors='coerce')
-    
-    data['DATETIME'] = pd.to_datetime(
-        data['DATE'].dt.strftime('%Y-%m-%d') + ' ' + data['TIME'].astype(str),
-        errors='coerce'
-    )
-
-    data = data.sort_values(by=['DATE', 'TIME']).reset_index(drop=True)
-    data = data.dropna(subset=['LAT', 'LON', 'MAG', 'DATETIME'])
-    return data
-
-def run():
-    data = load_data()
-
-    filtered_data = sidebar(data)
-    if 'DATETIME' not in filtered_data.columns:
-        filtered_data['DATETIME'] = pd.to_datetime(
-            filtered_data['DATE'].dt.strftime('%Y-%m-%d') + ' ' + filtered_data['TIME'].astype(str),
-            errors='coerce'
-        )
-    if filtered_data.empty:
-        st.sidebar.warning("No data available for the selected filters.")
-        return
-
-    # Title
-    st.title("Earthquake Flow Map")
-    st.markdown("Please zoom in to Central & Eastern Europe")
-
-    # Sort data by full datetime
-    filtered_data = filtered_data.sort_values(by='DATETIME').reset_index(drop=True)
-
-    if len(filtered_data) < 2:
-        st.warning("Not enough data to animate.")
-        return
-
-    # Initialize the plotly figure
-    fig = go.Figure()
+import numpy as np
+from catalog import load_catalog
+from filters import filter_index
+from perf import span
+from persist import figure_from_json, figure_json, persistent
+from sidebar import sidebar, selection_key
+from transport import floats
+
+MAX_FRAMES = 200
+
+# Split the chronological path into at most max_frames consecutive batches.
+# Each frame carries only its own batch and writes it into its own trace, so
+# earlier segments stay on the map and every point is sent once.
+def build_frames(lon, lat, text, mag, max_frames):
+    import plotly.graph_objects as go
+
+    bounds = np.unique(np.linspace(1, len(lon), min(max_frames, len(lon) - 1) + 1).astype(int))
     frames = []
-
-    # Creating frames for animation
-    for i in range(1, len(filtered_data) + 1):
-        data_subset = filtered_data.iloc[:i]
-        lon_vals = data_subset['LON'].tolist()
-        lat_vals = data_subset['LAT'].tolist()
-
+    for k, (start, end) in enumerate(zip(bounds[:-1], bounds[1:])):
+        # Start one point back so consecutive segments join up
+        segment = slice(start - 1, end)
         frames.append(go.Frame(
-            data=[
-                go.Scattermap(
-                    mode='lines',
-                    lon=lon_vals,
-                    lat=lat_vals,
-                    line=dict(width=2, color='blue'),
-                    hoverinfo='text',
-                    hovertext=[f"Datetime: {row['DATETIME']}<br>Magnitude: {row['MAG']}" for _, row in data_subset.iterrows()],
-                )
-            ],
-            name=f"frame_{i}"
+            data=[go.Scattermap(lon=lon[segment], lat=lat[segment], text=text[segment], customdata=mag[segment])],
+            traces=[k],
+            name=f"frame_{k + 1}"
         ))
-
-    # Adding empty initial trace fo r the map
-    fig.add_trace(go.Scattermap(
-        mode='lines',
-        lon=[],
-        lat=[],
-        line=dict(width=2, color='blue'),
-        hoverinfo='text',
-        hovertext="",
-    ))
+    return frames
+
+@st.cache_data(max_entries=8, show_spinner="Building flow animation...")
+@persistent("flowMap.figure", dump=figure_json, load=figure_from_json)
+def build_figure(_data, key, max_frames):
+    # Deferred until the first figure is built, like the other heavy imports
+    import plotly.graph_objects as go
+
+    # Coordinates and magnitudes travel as float32 typed arrays; only the
+    # timestamps are strings, formatted to the second
+    lon = floats(_data['LON'])
+    lat = floats(_data['LAT'])
+    mag = floats(_data['MAG'])
+    text = np.char.replace(np.datetime_as_string(_data['DATETIME'].to_numpy(), unit='s'), 'T', ' ')
+
+    frames = build_frames(lon, lat, text, mag, max_frames)
+
+    # One initially empty trace per frame
+    fig = go.Figure(data=[
+        go.Scattermap(
+            mode='lines',
+            lon=[],
+            lat=[],
+            line=dict(width=2, color='blue'),
+            hovertemplate="Datetime: %{text}<br>Magnitude: %{customdata:.1f}<extra></extra>",
+            showlegend=False,
+        )
+        for _ in frames
+    ])
 
     # Update layout and buttons for animation
     fig.update_layout(
         mapbox_style="carto-positron",  
         mapbox_zoom=4,  
-        mapbox_center={"lat": filtered_data['LAT'].mean(), "lon": filtered_data['LON'].mean()},
+        mapbox_center={"lat": float(lat.mean()), "lon": float(lon.mean())},
         margin={"r": 0, "t": 50, "l": 0, "b": 0},
         title="Earthquake Flow Map (Chronological Path)",
         updatemenus=[dict(
@@ -95,9 +73,48 @@ def run():
         )]
     )
     fig.frames = frames
+    return fig
+
+# Default view of a new session: every valid event, no filters applied
+def warm_up(catalog):
+    data = catalog.take(filter_index(catalog).query())
+    if len(data) >= 2:
+        build_figure(data, (catalog.digest, ()), MAX_FRAMES)
+
+def run():
+    with span("load"):
+        catalog = load_catalog()
+
+    with span("filter"):
+        filtered_data = sidebar(catalog)
+    if filtered_data.empty:
+        st.sidebar.warning("No data available for the selected filters.")
+        return
+
+    # Title
+    st.title("Earthquake Flow Map")
+    st.markdown("Please zoom in to Central & Eastern Europe")
+
+    # DATETIME is parsed once with the catalog, whose rows are already in
+    # chronological order
+    filtered_data = filtered_data.reset_index(drop=True)
+
+    if len(filtered_data) < 2:
+        st.warning("Not enough data to animate.")
+        return
+
+    max_frames = st.select_slider(
+        "Maximum animation frames",
+        options=[25, 50, 100, 200, 400],
+        value=MAX_FRAMES
+    )
+
+    with span("figure"):
+        fig = build_figure(filtered_data, selection_key(), max_frames)
 
     # Display the map animation
-    st.plotly_chart(fig, use_container_width=True)
+    with span("render", payload=fig.to_json):
+        st.plotly_chart(fig, use_container_width=True)
     st.subheader("Filtered Earthquake Data")
 
     earthquake_count = len(filtered_data)
@@ -0,0 +1,102 @@
+import numpy as np
+import pandas as pd
+
+import persist
+from aggregate import pyramid
+from cube import MAG_STEP
+from filters import select
+
+# Maximum curvature underestimates the magnitude of completeness; this is
+# the usual correction (Woessner & Wiemer, 2005)
+MC_CORRECTION = 0.2
+
+
+def fit(counts, origin):
+    # Gutenberg-Richter fit of every row of counts, a histogram over the
+    # magnitude bins origin, origin + 1, ... (in MAG_STEP units): Mc by
+    # maximum curvature, then Aki's maximum-likelihood b-value with Utsu's
+    # bin correction and the Shi & Bolt standard error. Every row is fitted
+    # at once, from the moments of its bins at and above Mc.
+    groups, bins = counts.shape
+    magnitudes = (origin + np.arange(bins)) * MAG_STEP
+    mc_bin = counts.argmax(axis=1) + int(round(MC_CORRECTION / MAG_STEP))
+    beyond = mc_bin >= bins
+    mc_bin = np.minimum(mc_bin, bins - 1)
+
+    complete = np.where(np.arange(bins) >= mc_bin[:, None], counts, 0).astype(np.float64)
+    complete[beyond] = 0
+    n = complete.sum(axis=1)
+    sum1 = complete @ magnitudes
+    sum2 = complete @ magnitudes ** 2
+    mc = magnitudes[mc_bin]
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean = sum1 / n
+        b = np.log10(np.e) / (mean - (mc - MAG_STEP / 2))
+        variance = np.maximum(sum2 - n * mean ** 2, 0) / (n * (n - 1))
+        b_err = 2.3 * b ** 2 * np.sqrt(variance)
+        a = np.log10(n) + b * mc
+    unusable = (n < 2) | ~(b > 0)
+    for values in (b, b_err, a):
+        values[unusable] = np.nan
+    return n.astype(np.int64), mc.round(1), b, b_err, a
+
+
+class GutenbergRichter:
+    # b-values and Mc for the whole catalog and for every occupied (grid
+    # cell, time window). The events are binned by magnitude into one
+    # histogram per group in a single bincount, and all groups are fitted
+    # together.
+    def __init__(self, catalog, level, years=None, declustering=None):
+        columns = catalog.columns
+        rows = select(catalog, declustering=declustering)
+        mag_bin = np.rint(columns["MAG"][rows].astype(np.float64) / MAG_STEP).astype(np.int64)
+        origin = int(mag_bin.min()) if len(rows) else 0
+        bins = int(mag_bin.max()) - origin + 1 if len(rows) else 1
+
+        self.size, centre_lat, centre_lon, cell_of = pyramid(catalog).levels[level]
+        year = columns["EPOCH"][rows].view("datetime64[ns]").astype("datetime64[Y]").astype(np.int64) + 1970
+        first = int(year.min()) if len(rows) else 0
+        window = (year - first) // years if years else np.zeros(len(rows), dtype=np.int64)
+
+        cells = len(centre_lat)
+        groups, group_of = np.unique(window * cells + cell_of[rows], return_inverse=True)
+        counts = np.bincount(group_of * bins + (mag_bin - origin), minlength=len(groups) * bins)
+        counts = counts.reshape(len(groups), bins)
+
+        # Frequency-magnitude distribution of the whole catalog
+        self.magnitudes = ((origin + np.arange(bins)) * MAG_STEP).round(1)
+        self.histogram = counts.sum(axis=0)
+        n, mc, b, b_err, a = fit(self.histogram[None, :], origin)
+        self.overall = {"N": int(n[0]), "MC": float(mc[0]), "B": float(b[0]), "B_ERR": float(b_err[0]), "A": float(a[0])}
+
+        n, mc, b, b_err, a = fit(counts, origin)
+        start = first + (groups // cells) * (years or 0)
+        self.cells = pd.DataFrame({
+            "LAT": centre_lat[groups % cells],
+            "LON": centre_lon[groups % cells],
+            "START": start,
+            "END": start + years - 1 if years else np.full(len(groups), int(year.max()) if len(rows) else 0),
+            "EVENTS": counts.sum(axis=1),
+            "N": n,
+            "MC": mc,
+            "B": b,
+            "B_ERR": b_err,
+            "A": a,
+        })
+
+    def windows(self):
+        return np.unique(self.cells["START"].to_numpy())
+
+    def window(self, start, min_events):
+        # Cells of one time window with at least min_events above their Mc
+        cells = self.cells[(self.cells["START"] == start) & (self.cells["N"] >= min_events)]
+        return cells.dropna(subset=["B"])
+
+
+def gutenberg_richter(catalog, level, years=None, declustering=None):
+    # Per catalog version and on disk, as the statistics cube
+    key = (level, years, declustering)
+    return catalog.derived(("gutenberg_richter", *key), lambda catalog: persist.get_or_build(
+        "gutenberg_richter", (catalog.digest, *key),
+        lambda: GutenbergRichter(catalog, *key)))
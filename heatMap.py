@@ -1,67 +1,123 @@
-import pandas as pd
+import json
+import os
+import numpy as np
 import streamlit as st
-import folium
-from streamlit_folium import st_folium
-from folium.plugins import MarkerCluster, HeatMap
-from sidebar import sidebar  
+from aggregate import aggregate
+from catalog import CARPATHIANS_PATH, CSV_PATH, load_catalog
+from filters import filter_index
+from perf import span
+from sidebar import sidebar, selection_key
 
-@st.cache_data
-def load_data():
-    data = pd.read_csv("dataIN/Carpathians_Earthquakes.csv", index_col=0)
-    data.reset_index(inplace=True)
+# Level of detail: only the strongest events get an individual marker, and the
+# heat layer is fed aggregated grid cells instead of raw events
+MAX_MARKERS = 5000
+MAX_HEAT_CELLS = 10000
 
-    data = data.drop(data.columns[list(range(3)) + list(range(-4, -1))], axis=1)
-    data['DATE'] = pd.to_datetime(data['DATE'], errors='coerce')
+POPUP_TEMPLATE = """
+    <h4 style="font-size: 16px; font-weight: bold; color: #2d3e50;">Earthquake Information</h4>
+    <hr style="border: 1px solid #2d3e50;">
+    <p style="font-size: 14px; margin: 5px 0;"><strong>Location:</strong> {lat}, {lon}</p>
+    <p style="font-size: 14px; margin: 5px 0;"><strong>Magnitude:</strong> {mag}</p>
+    <p style="font-size: 14px; margin: 5px 0;"><strong>Date:</strong> {date}</p>
+    <p style="font-size: 14px; margin: 5px 0;"><strong>Time:</strong> {time}</p>
+"""
 
-    return data
+# Markers are created in the browser from compact [lat, lon, mag, epoch seconds]
+# rows; each popup is rendered from the template only when it is opened.
+# folium inserts the callback as `var callback = ...;`, so it is one function
+# expression, closing over the template.
+MARKER_CALLBACK = """(function () {
+    var template = %s;
+    return function (row) {
+        var marker = L.marker(new L.LatLng(row[0], row[1]));
+        marker.bindPopup(function () {
+            var when = new Date(row[3] * 1000).toISOString();
+            return template
+                .replace("{lat}", row[0]).replace("{lon}", row[1])
+                .replace("{mag}", row[2])
+                .replace("{date}", when.slice(0, 10)).replace("{time}", when.slice(11, 22));
+        }, {maxWidth: 300});
+        return marker;
+    };
+})()""" % json.dumps(POPUP_TEMPLATE)
+
+@st.cache_data(max_entries=8, show_spinner=False)
+def build_layers(_catalog, _data, key, max_markers=MAX_MARKERS):
+    lat = _data['LAT'].to_numpy(np.float64).round(4)
+    lon = _data['LON'].to_numpy(np.float64).round(4)
+    mag = _data['MAG'].to_numpy(np.float64).round(1)
+
+    # Each cell weighs as much as its events did individually (sum of MAG)
+    cells, _ = aggregate(_catalog, _data.index.to_numpy(), MAX_HEAT_CELLS)
+    heat = cells[['LAT', 'LON', 'MAG_SUM']].to_numpy().round(4)
+
+    strongest = np.arange(len(mag))
+    if len(mag) > max_markers:
+        strongest = np.argpartition(-mag, max_markers - 1)[:max_markers]
+    seconds = _data['DATETIME'].to_numpy('datetime64[ms]').astype(np.int64)[strongest] / 1000
+    markers = np.column_stack([lat[strongest], lon[strongest], mag[strongest], seconds])
+
+    return heat, markers
+
+def build_map(heat, markers):
+    import folium
+    from folium.plugins import FastMarkerCluster, HeatMap
+
+    earthquake_map = folium.Map(location=[20, 0], zoom_start=3)
+
+    # The layers are built empty and handed the arrays directly: rows are
+    # already validated, so folium's per-row checks are skipped
+    marker_cluster = FastMarkerCluster([], callback=MARKER_CALLBACK)
+    marker_cluster.data = markers.tolist()
+    marker_cluster.add_to(earthquake_map)
+
+    heat_layer = HeatMap([])
+    heat_layer.data = heat.tolist()
+    heat_layer.add_to(earthquake_map)
+
+    return earthquake_map
+
+# Default view of a new session: every valid event, no filters applied
+def warm_up(catalog):
+    data = catalog.take(filter_index(catalog).query())
+    heat, markers = build_layers(catalog, data, (catalog.digest, ()))
+    build_map(heat, markers)
 
 def run():
-    data = load_data()
+    from streamlit_folium import st_folium
 
-    filtered_data = sidebar(data)
+    # The Carpathians catalog is offered when its file is present; both are
+    # read through the same binary store
+    sources = {"Earthquake catalog": CSV_PATH, "Carpathians": CARPATHIANS_PATH}
+    sources = {label: path for label, path in sources.items() if os.path.exists(path)}
+    source = st.sidebar.radio("Catalog", list(sources)) if len(sources) > 1 else next(iter(sources), None)
+
+    with span("load"):
+        catalog = load_catalog(sources.get(source, CSV_PATH))
+
+    with span("filter"):
+        filtered_data = sidebar(catalog)
     if filtered_data.empty:
         st.sidebar.warning("No data available for the selected filters.")
         return
 
-    #Map initialization
-    earthquake_map = folium.Map(location=[20, 0], zoom_start=3)
+    with span("aggregate"):
+        heat, markers = build_layers(catalog, filtered_data, selection_key())
 
-    # Marker Clusters on the map
-    marker_cluster = MarkerCluster().add_to(earthquake_map)
-
-    # Markers on the map
-    for _, row in st.session_state.filtered_data.iterrows():
-        folium.Marker(
-            location=[row['LAT'], row['LON']],
-            popup=folium.Popup(f"""
-                <html>
-                    <body>
-                        <h4 style="font-size: 16px; font-weight: bold; color: #2d3e50;">Earthquake Information</h4>
-                        <hr style="border: 1px solid #2d3e50;">
-                        <p style="font-size: 14px; margin: 5px 0;"><strong>Location:</strong> {row['LAT']}, {row['LON']}</p>
-                        <p style="font-size: 14px; margin: 5px 0;"><strong>Magnitude:</strong> {row['MAG']}</p>
-                        <p style="font-size: 14px; margin: 5px 0;"><strong>Date:</strong> {row['DATE']}</p>
-                        <p style="font-size: 14px; margin: 5px 0;"><strong>Time:</strong> {row['TIME']}</p>
-                    </body>
-                </html>
-            """, max_width=300)
-        ).add_to(marker_cluster)
-
-    # Heatmap
-    heat_data = [
-        [row['LAT'], row['LON'], row['MAG']] 
-        for _, row in st.session_state.filtered_data.dropna(subset=['LAT', 'LON', 'MAG']).iterrows()
-    ]
-    HeatMap(heat_data).add_to(earthquake_map)
+    with span("figure"):
+        earthquake_map = build_map(heat, markers)
 
     # Display the map
     st.title("Earthquake Heat & Cluster Map")
-    st_folium(earthquake_map, width=800, height=500)
+    with span("render", payload=lambda: earthquake_map.get_root().render()):
+        st_folium(earthquake_map, width=800, height=500)
+    if len(markers) < len(filtered_data):
+        st.caption(f"Markers show the {len(markers):,} strongest of {len(filtered_data):,} earthquakes; the heat layer includes all of them.")
 
     with st.expander("Map Details & Interpretation"):
         st.markdown("""
     **What's on the map?**
-    - Each marker represents an individual earthquake within the selected filters.
+    - Each marker represents an individual earthquake within the selected filters (the strongest ones when there are too many to draw).
     - The **popup** on each marker shows detailed info: location, magnitude, date, and time.
     - The **heatmap layer** represents the density and magnitude of earthquakes in a region.
   
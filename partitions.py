@@ -0,0 +1,91 @@
+import numpy as np
+
+# Partition grains: calendar years or calendar months
+GRAINS = {"Y": "datetime64[Y]", "M": "datetime64[M]"}
+
+FIELDS = ["key", "start", "stop", "mag_min", "mag_max", "depth_min", "depth_max"]
+
+
+def partition_table(columns, grain="Y"):
+    # The catalog is chronological, so every year (or month) is a contiguous
+    # row range of the column files. Returns those ranges with min/max
+    # statistics of MAG and DEPTH, skipping empty periods and undated rows
+    # (which sort first and never match a year filter).
+    epoch = columns["EPOCH"]
+    dated = int(np.searchsorted(epoch, np.iinfo(np.int64).min, side="right"))
+    if dated == len(epoch):
+        return {field: [] for field in FIELDS}
+
+    unit = GRAINS[grain]
+    first = epoch[dated:dated + 1].view("datetime64[ns]").astype(unit).astype(np.int64)[0]
+    last = epoch[-1:].view("datetime64[ns]").astype(unit).astype(np.int64)[0]
+    keys = np.arange(first, last + 2)
+    edges = np.searchsorted(epoch, keys.astype(unit).astype("datetime64[ns]").view(np.int64), side="left")
+    edges[0] = dated
+    occupied = edges[1:] > edges[:-1]
+    starts, stops = edges[:-1][occupied], edges[1:][occupied]
+
+    table = {"key": keys[:-1][occupied].tolist(), "start": starts.tolist(), "stop": stops.tolist()}
+    for name in ("MAG", "DEPTH"):
+        column = np.asarray(columns[name], dtype=np.float64)
+        # NaN-ignoring; a partition with no values at all keeps NaN and is
+        # then pruned by every bound on that column
+        with np.errstate(invalid="ignore"):
+            table[f"{name.lower()}_min"] = np.fmin.reduceat(column, starts).tolist()
+            table[f"{name.lower()}_max"] = np.fmax.reduceat(column, starts).tolist()
+    return table
+
+
+class Partitions:
+    # Zone maps over the catalog's year or month partitions. prune drops the
+    # partitions whose statistics rule a filter out: FilterIndex uses it to
+    # skip year blocks of its in-memory index, and scan to read only the row
+    # ranges of the partitions left from the memory-mapped columns, for
+    # callers that do without the index (the API's event stream).
+    def __init__(self, table, grain="Y"):
+        self.grain = grain
+        for field in FIELDS:
+            setattr(self, field, np.asarray(table[field], dtype=np.float64 if "_" in field else np.int64))
+        self.year = self.key + 1970 if grain == "Y" else self.key // 12 + 1970
+
+    def __len__(self):
+        return len(self.key)
+
+    def prune(self, min_mag=None, start_year=None, end_year=None, depth_range=None):
+        # Partitions that can hold a matching row (NaN statistics compare False)
+        keep = np.ones(len(self), dtype=bool)
+        if start_year is not None:
+            keep &= self.year >= start_year
+        if end_year is not None:
+            keep &= self.year <= end_year
+        if min_mag is not None:
+            keep &= self.mag_max >= np.float32(min_mag)
+        if depth_range is not None:
+            keep &= (self.depth_max >= np.float32(depth_range[0])) & (self.depth_min <= np.float32(depth_range[1]))
+        return np.flatnonzero(keep)
+
+    def scan(self, columns, min_mag=None, start_year=None, end_year=None, depth_range=None):
+        # Catalog positions of the rows the sidebar would keep for these
+        # filters, as FilterIndex.query finds them; partitions never straddle
+        # a year, so the year bounds need no row check
+        parts = []
+        for p in self.prune(min_mag, start_year, end_year, depth_range):
+            start, stop = self.start[p], self.stop[p]
+            mag, depth = columns["MAG"][start:stop], columns["DEPTH"][start:stop]
+            mask = (mag > 0) & (depth > 0)
+            mask &= ~np.isnan(columns["LAT"][start:stop]) & ~np.isnan(columns["LON"][start:stop])
+            if min_mag is not None:
+                mask &= mag >= np.float32(min_mag)
+            if depth_range is not None:
+                mask &= (depth >= np.float32(depth_range[0])) & (depth <= np.float32(depth_range[1]))
+            parts.append(start + np.flatnonzero(mask))
+        return np.concatenate(parts) if parts else np.empty(0, dtype=np.int64)
+
+
+def partitions(catalog, grain="Y"):
+    # Statistics written with the binary catalog, or computed for one that
+    # predates them
+    def build(catalog):
+        table = catalog.meta.get("partitions", {}).get(grain)
+        return Partitions(table if table is not None else partition_table(catalog.columns, grain), grain)
+    return catalog.derived(("partitions", grain), build)
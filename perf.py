@@ -0,0 +1,139 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+import pandas as pd
+import streamlit as st
+
+LOG_PATH = os.environ.get("EARTHQUAKE_PERF_LOG", "perf.jsonl")
+HISTORY = 20
+
+# Time-to-first-render target: the first rerun of every page in a fresh
+# process, which the first visitor after a deploy waits for
+FIRST_RENDER_TARGET_S = float(os.environ.get("EARTHQUAKE_FIRST_RENDER_TARGET", 3.0))
+
+logger = logging.getLogger("earthquake.perf")
+
+# Last HISTORY reruns of every page, across all sessions of the process
+_history = defaultdict(lambda: deque(maxlen=HISTORY))
+_first_render = {}
+_lock = threading.Lock()
+
+# Rerun being recorded on the current script thread
+_local = threading.local()
+
+
+def _log(record):
+    # The log file is opened by the first recorded rerun, so that scripts
+    # importing the pages, such as export.py, leave no perf.jsonl behind
+    with _lock:
+        if not logger.handlers:
+            handler = logging.FileHandler(LOG_PATH)
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            logger.addHandler(handler)
+            logger.setLevel(logging.INFO)
+            logger.propagate = False
+    logger.info(json.dumps(record))
+
+
+def _rss():
+    # Resident set size in bytes (Linux); None where /proc is unavailable
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return None
+
+
+def debug_enabled():
+    # ?debug=1 in the URL or EARTHQUAKE_DEBUG=1 turns on the panel and payload sizes
+    if os.environ.get("EARTHQUAKE_DEBUG"):
+        return True
+    try:
+        return st.query_params.get("debug") not in (None, "", "0")
+    except Exception:
+        return False
+
+
+@contextmanager
+def rerun(page):
+    record = {"page": page, "timestamp": time.time(), "spans": []}
+    _local.rerun = record
+    start, rss = time.perf_counter(), _rss()
+    try:
+        yield record
+    finally:
+        _local.rerun = None
+        record["seconds"] = round(time.perf_counter() - start, 4)
+        end_rss = _rss()
+        record["memory_delta"] = None if rss is None or end_rss is None else end_rss - rss
+        with _lock:
+            if page not in _first_render:
+                _first_render[page] = record["seconds"]
+                record["first_render"] = True
+                record["target_met"] = record["seconds"] <= FIRST_RENDER_TARGET_S
+            _history[page].append(record)
+        _log(record)
+
+
+@contextmanager
+def span(name, payload=None):
+    # Times a block of the current rerun; payload is a callable returning what
+    # is sent to the browser, measured only in debug mode as it costs a
+    # second serialisation
+    start, rss = time.perf_counter(), _rss()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        end_rss = _rss()
+        record = getattr(_local, "rerun", None)
+        if record is not None:
+            entry = {
+                "name": name,
+                "seconds": round(seconds, 4),
+                "memory_delta": None if rss is None or end_rss is None else end_rss - rss,
+            }
+            if payload is not None and debug_enabled():
+                data = payload()
+                entry["payload_bytes"] = len(data.encode() if isinstance(data, str) else data)
+            record["spans"].append(entry)
+
+
+def history(page):
+    with _lock:
+        return list(_history[page])
+
+
+def first_render(page):
+    with _lock:
+        return _first_render.get(page)
+
+
+def debug_panel(page):
+    reruns = history(page)
+    if not reruns:
+        return
+
+    rows = []
+    for record in reversed(reruns):
+        row = {
+            "time": pd.Timestamp(record["timestamp"], unit="s").strftime("%H:%M:%S"),
+            "total (s)": record["seconds"],
+            "memory Δ (MB)": None if record["memory_delta"] is None else round(record["memory_delta"] / 2**20, 1),
+        }
+        for entry in record["spans"]:
+            row[f"{entry['name']} (s)"] = entry["seconds"]
+            if "payload_bytes" in entry:
+                row[f"{entry['name']} payload (KB)"] = round(entry["payload_bytes"] / 2**10, 1)
+        rows.append(row)
+
+    with st.expander(f"🛠️ Performance: last {len(rows)} reruns of `{page}`"):
+        seconds = first_render(page)
+        status = "within" if seconds <= FIRST_RENDER_TARGET_S else "over"
+        st.write(f"**First render:** {seconds:.2f} s, {status} the {FIRST_RENDER_TARGET_S:g} s target")
+        st.dataframe(pd.DataFrame(rows), use_container_width=True)
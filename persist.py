@@ -0,0 +1,174 @@
+import functools
+import hashlib
+import importlib
+import inspect
+import logging
+import os
+import pickle
+import sys
+import tempfile
+import time
+
+# Disk cache shared by every process and replica that mounts the same
+# directory. Entries are keyed by the catalog's content digest and the
+# parameters of the computation, so a restart or another replica reuses the
+# results instead of rebuilding them. EARTHQUAKE_CACHE_DIR="" turns it off.
+CACHE_DIR = os.environ.get("EARTHQUAKE_CACHE_DIR", "dataOUT/.cache")
+MAX_BYTES = int(float(os.environ.get("EARTHQUAKE_CACHE_MB", 512)) * 2**20)
+
+# Temporary files older than this were left behind by a crashed writer
+STALE_TMP_S = 3600
+
+# Directory of the repo's own modules, whose source is part of every key.
+# Every entry is computed from a Catalog, whose methods the builders call
+# without importing its module, so that module is always part of it too.
+ROOT = os.path.dirname(os.path.abspath(__file__))
+ALWAYS = ["catalog"]
+
+log = logging.getLogger(__name__)
+
+_MISSING = object()
+_sources = {}
+
+
+def _local_imports(module):
+    # The repo's modules that module imports, itself or through names from them
+    for value in vars(module).values():
+        imported = value if inspect.ismodule(value) else sys.modules.get(getattr(value, "__module__", None) or "")
+        path = getattr(imported, "__file__", None)
+        if path and os.path.dirname(os.path.abspath(path)) == ROOT:
+            yield imported
+
+
+def source_hash(function):
+    # Hash of the source of the module of function (or the module itself) and
+    # of the repo's modules it depends on, directly or not; entries are
+    # invalidated whenever any of them changes
+    module = inspect.getmodule(function)
+    if module.__name__ not in _sources:
+        stack = [module, *map(importlib.import_module, ALWAYS)]
+        seen = {module.__name__: module for module in stack}
+        while stack:
+            for imported in _local_imports(stack.pop()):
+                if imported.__name__ not in seen:
+                    seen[imported.__name__] = imported
+                    stack.append(imported)
+        digest = hashlib.sha256()
+        for name in sorted(seen):
+            digest.update(inspect.getsource(seen[name]).encode())
+        _sources[module.__name__] = digest.hexdigest()[:16]
+    return _sources[module.__name__]
+
+
+def _path(name, key):
+    digest = hashlib.sha256(repr(key).encode()).hexdigest()[:32]
+    return os.path.join(CACHE_DIR, f"{name}-{digest}.bin")
+
+
+def get(name, key, load=pickle.loads):
+    path = _path(name, key)
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except OSError:
+        return _MISSING
+    try:
+        value = load(data)
+    except Exception:
+        # Written by an incompatible library version; rebuilt and overwritten
+        return _MISSING
+    try:
+        # The modification time doubles as the last use for eviction
+        os.utime(path)
+    except OSError:
+        pass
+    return value
+
+
+def put(name, key, value, dump=pickle.dumps):
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        # Written under a temporary name and renamed into place, so readers in
+        # other processes see either the old entry or the complete new one
+        fd, tmp = tempfile.mkstemp(dir=CACHE_DIR, prefix=".tmp-")
+        with os.fdopen(fd, "wb") as f:
+            f.write(dump(value))
+        # mkstemp creates owner-only files; other replicas may run as other users
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, _path(name, key))
+        evict()
+    except OSError:
+        # The cache is an optimisation; a full or read-only disk is not an error
+        log.warning("Could not write %s to the disk cache", name, exc_info=True)
+
+
+def evict(max_bytes=None):
+    # Least recently used entries go first until the directory fits the budget.
+    # Concurrent evictions may race on the same file, which is harmless.
+    max_bytes = MAX_BYTES if max_bytes is None else max_bytes
+    entries, total = [], 0
+    for entry in os.scandir(CACHE_DIR):
+        try:
+            stat = entry.stat()
+        except FileNotFoundError:
+            continue
+        if entry.name.startswith(".tmp-"):
+            if stat.st_mtime < time.time() - STALE_TMP_S:
+                _remove(entry.path)
+            continue
+        entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total += stat.st_size
+
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        _remove(path)
+        total -= size
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def get_or_build(name, key, build, dump=pickle.dumps, load=pickle.loads, source=None):
+    # source is the function whose module the result depends on, build by default
+    if not CACHE_DIR:
+        return build()
+    key = (source_hash(source or build), key)
+    value = get(name, key, load)
+    if value is _MISSING:
+        value = build()
+        put(name, key, value, dump)
+    return value
+
+
+def persistent(name, dump=pickle.dumps, load=pickle.loads):
+    # Disk-backed counterpart of st.cache_data, meant to sit underneath it:
+    # as there, parameters starting with an underscore are not part of the key
+    # and the arguments that are must identify the result on their own
+    def decorate(function):
+        signature = inspect.signature(function)
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            key = tuple((k, v) for k, v in bound.arguments.items() if not k.startswith("_"))
+            return get_or_build(name, key, lambda: function(*args, **kwargs), dump, load, function)
+
+        return wrapper
+
+    return decorate
+
+
+def figure_json(fig):
+    return fig.to_json().encode()
+
+
+def figure_from_json(data):
+    import plotly.io as pio
+
+    return pio.from_json(data.decode(), skip_invalid=True)
@@ -0,0 +1,177 @@
+import copy
+
+import numpy as np
+import pandas as pd
+from scipy.special import pdtrc
+
+import persist
+from aggregate import energy, pyramid
+from filters import select
+
+NS_PER_S = 10**9
+
+# Rolling windows, in seconds
+WINDOWS = {
+    "1 Hour": 3600,
+    "6 Hours": 6 * 3600,
+    "1 Day": 86400,
+    "7 Days": 7 * 86400,
+    "30 Days": 30 * 86400,
+}
+
+# A swarm is a run of events whose windows hold at least MIN_EVENTS events
+# and would hold that many by chance with at most the given probability, were
+# the cell's events a Poisson process at its long-term rate
+MIN_EVENTS = 5
+PROBABILITY = 1e-6
+
+# Events are ordered by (cell, time) through one int64 key: the cell in the
+# high bits and the second, offset by 2**33 (about 272 years either side of
+# 1970), in the low 34
+TIME_BITS = 34
+TIME_OFFSET = 2**33
+
+
+def moment(mag):
+    # Seismic moment in N·m (Hanks & Kanamori: log10 M0 = 1.5 Mw + 9.1)
+    return np.nan_to_num(10 ** (1.5 * mag.astype(np.float64) + 9.1))
+
+
+def rolling(seconds, values, window):
+    # Events in the window (t - window, t] ending at each of the time-sorted
+    # events, and the sum of values over it, from a binary search per event
+    # and a cumulative sum
+    position = np.arange(len(seconds))
+    lo = np.searchsorted(seconds, seconds - window, side="right")
+    total = np.concatenate([[0.0], np.cumsum(values)])
+    return position - lo + 1, total[position + 1] - total[lo]
+
+
+def envelope(seconds, columns, points):
+    # Largest value of each column in each of points equal time bins, for
+    # plotting a long per-event series without losing its peaks
+    if not len(seconds):
+        return np.empty(0, dtype=np.int64), [np.empty(0) for _ in columns]
+    edges = np.linspace(seconds[0], seconds[-1] + 1, points + 1).astype(np.int64)
+    starts = np.unique(np.searchsorted(seconds, edges[:-1]))
+    starts = starts[starts < len(seconds)]
+    return seconds[starts], [np.maximum.reduceat(column, starts) for column in columns]
+
+
+class SeismicityRate:
+    # Rolling event counts and energy and moment release of every grid cell
+    # at one pyramid level. The events are kept ordered by (cell, time), so
+    # each cell is a time-sorted run and every event's window is one binary
+    # search over the whole array; sums over windows are differences of
+    # cumulative sums. Windows only look back, so appended events leave the
+    # counts of the earlier ones unchanged.
+    def __init__(self, catalog, level, window, declustering=None):
+        self.level = level
+        self.window = window
+        self.declustering = declustering
+        self.key = np.empty(0, dtype=np.int64)
+        self.rows = np.empty(0, dtype=np.int64)
+        self.count = np.empty(0, dtype=np.int64)
+        self.energy = np.empty(0)
+        self.moment = np.empty(0)
+        self._add(catalog, select(catalog, declustering=declustering))
+
+    def _add(self, catalog, rows):
+        # Merges rows, all later than the events already held, into the
+        # (cell, time) order and counts the windows ending at them
+        columns = catalog.columns
+        _, self.centre_lat, self.centre_lon, cell_of = pyramid(catalog).levels[self.level]
+        key = (cell_of[rows].astype(np.int64) << TIME_BITS) + columns["EPOCH"][rows] // NS_PER_S + TIME_OFFSET
+        order = np.argsort(key, kind="stable")
+        key, rows = key[order], rows[order]
+
+        at = np.searchsorted(self.key, key, side="right")
+        added = at + np.arange(len(key))
+        self.key = np.insert(self.key, at, key)
+        self.rows = np.insert(self.rows, at, rows)
+        self.energy = np.insert(self.energy, at, energy(columns["MAG"][rows]))
+        self.moment = np.insert(self.moment, at, moment(columns["MAG"][rows]))
+        self.total_energy = np.concatenate([[0.0], np.cumsum(self.energy)])
+        self.total_moment = np.concatenate([[0.0], np.cumsum(self.moment)])
+
+        # The key of the window start stays in the event's cell, so the search
+        # never crosses into the previous cell's run
+        count = added - np.searchsorted(self.key, self.key[added] - self.window, side="right") + 1
+        self.count = np.insert(self.count, at, 0)
+        self.count[added] = count
+
+    def extend(self, catalog, start):
+        rows = select(catalog, declustering=self.declustering)
+        engine = copy.copy(self)
+        engine._add(catalog, rows[np.searchsorted(rows, start):])
+        return engine
+
+    @property
+    def cell(self):
+        return self.key >> TIME_BITS
+
+    @property
+    def seconds(self):
+        return (self.key & (2**TIME_BITS - 1)) - TIME_OFFSET
+
+    def expected(self):
+        # Events each event's window would hold at its cell's long-term rate
+        seconds = self.seconds
+        span = max(int(seconds.max() - seconds.min()), self.window) if len(seconds) else self.window
+        _, per_cell = np.unique(self.cell, return_counts=True)
+        return np.repeat(per_cell * (self.window / span), per_cell)
+
+    def swarms(self, probability=PROBABILITY, min_events=MIN_EVENTS):
+        # Flagged events of one cell less than a window apart form one swarm;
+        # it starts with the first event of its first flagged window
+        cell, seconds, expected = self.cell, self.seconds, self.expected()
+        # Probability of at least count events in the window
+        chance = pdtrc(self.count - 1, expected)
+        flagged = np.flatnonzero((self.count >= min_events) & (chance <= probability))
+
+        new = np.ones(len(flagged), dtype=bool)
+        new[1:] = (cell[flagged[1:]] != cell[flagged[:-1]]) | (seconds[flagged[1:]] - seconds[flagged[:-1]] > self.window)
+        starts = np.flatnonzero(new)
+        swarm = np.cumsum(new) - 1
+        first = flagged[starts]
+        last = flagged[np.r_[starts[1:] - 1, len(flagged) - 1]] if len(flagged) else flagged
+        begin = first - self.count[first] + 1
+        peak = flagged[np.lexsort((-self.count[flagged], swarm))[starts]] if len(flagged) else flagged
+
+        return pd.DataFrame({
+            "LAT": self.centre_lat[cell[first]],
+            "LON": self.centre_lon[cell[first]],
+            "START": (seconds[begin] * NS_PER_S).view("datetime64[ns]"),
+            "PEAK": (seconds[peak] * NS_PER_S).view("datetime64[ns]"),
+            "END": (seconds[last] * NS_PER_S).view("datetime64[ns]"),
+            "EVENTS": last - begin + 1,
+            "PEAK_COUNT": self.count[peak],
+            "EXPECTED": expected[peak],
+            "PROBABILITY": np.minimum.reduceat(chance[flagged], starts) if len(flagged) else np.empty(0),
+            "ENERGY": self.total_energy[last + 1] - self.total_energy[begin],
+            "MOMENT": self.total_moment[last + 1] - self.total_moment[begin],
+            "ROW": self.rows[peak],
+        })
+
+    def cell_rows(self, lat, lon):
+        # Catalog rows of the events in the cell centred at (lat, lon)
+        cell = self.cell
+        return np.sort(self.rows[(self.centre_lat[cell] == lat) & (self.centre_lon[cell] == lon)])
+
+    def series(self, rows=None):
+        # Time-sorted seconds of the events (only those among rows, if given)
+        # with the count and energy of the window ending at each
+        order = np.argsort(self.rows, kind="stable")
+        if rows is not None:
+            order = order[np.isin(self.rows[order], rows, assume_unique=True)]
+        seconds = self.seconds[order]
+        count, released = rolling(seconds, self.energy[order], self.window)
+        return seconds, count, released
+
+
+def seismicity_rate(catalog, level, window, declustering=None):
+    # Per catalog version and on disk, as the statistics cube
+    key = (level, window, declustering)
+    return catalog.derived(("seismicity_rate", *key), lambda catalog: persist.get_or_build(
+        "seismicity_rate", (catalog.digest, *key),
+        lambda: SeismicityRate(catalog, *key)))
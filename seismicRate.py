@@ -0,0 +1,142 @@
+import numpy as np
+import streamlit as st
+from aggregate import LEVELS
+from catalog import load_catalog
+from perf import span
+from persist import figure_from_json, figure_json, persistent
+from rates import NS_PER_S, WINDOWS, envelope, seismicity_rate
+from sidebar import selection_declustering, selection_region
+from spatial import describe, spatial_index
+from transport import floats, integers
+
+CELL_SIZES = [1.0, 0.5, 0.25]
+PROBABILITIES = {"1 in 10,000": 1e-4, "1 in a million": 1e-6, "1 in 100 million": 1e-8}
+
+# Time bins of the plotted series; each shows the peak of the events in it
+POINTS = 2000
+
+@st.cache_data(max_entries=16, show_spinner="Detecting swarms...")
+def find_swarms(_catalog, digest, level, window, declustering, region, probability):
+    swarms = seismicity_rate(_catalog, level, window, declustering).swarms(probability)
+    if region is not None:
+        swarms = swarms[np.isin(swarms["ROW"].to_numpy(), spatial_index(_catalog).within(region))]
+    return swarms.sort_values("PROBABILITY", kind="stable").reset_index(drop=True)
+
+@st.cache_data(max_entries=16, show_spinner="Building rate series...")
+@persistent("seismicRate.figure", dump=figure_json, load=figure_from_json)
+def build_figure(_catalog, digest, level, window, declustering, region, probability, focus):
+    import plotly.graph_objects as go
+
+    engine = seismicity_rate(_catalog, level, window, declustering)
+    swarms = find_swarms(_catalog, digest, level, window, declustering, region, probability)
+    rows = None if region is None else spatial_index(_catalog).within(region)
+    if focus is not None:
+        rows = engine.cell_rows(*focus)
+        swarms = swarms[(swarms["LAT"] == focus[0]) & (swarms["LON"] == focus[1])]
+    seconds, count, released = engine.series(rows)
+    times, (peak_count, peak_energy) = envelope(seconds, [count, released], POINTS)
+
+    fig = go.Figure([
+        go.Scatter(
+            x=(times * NS_PER_S).view("datetime64[ns]"),
+            y=integers(peak_count),
+            mode="lines",
+            line=dict(color="steelblue", width=1),
+            name="Events in window",
+        ),
+        go.Scatter(
+            x=(times * NS_PER_S).view("datetime64[ns]"),
+            y=floats(peak_energy),
+            mode="lines",
+            line=dict(color="darkorange", width=1),
+            name="Energy released (J)",
+            yaxis="y2",
+            visible="legendonly",
+        ),
+    ])
+    if len(swarms):
+        # Marked at the series' count when the swarm peaked
+        at = np.maximum(np.searchsorted(seconds, swarms["PEAK"].to_numpy().view(np.int64) // NS_PER_S, side="right") - 1, 0)
+        fig.add_trace(go.Scatter(
+            x=swarms["PEAK"],
+            y=integers(count[at]),
+            mode="markers",
+            marker=dict(color="crimson", size=9, symbol="triangle-down"),
+            name="Detected swarm",
+            customdata=np.column_stack([
+                floats(swarms["LAT"]), floats(swarms["LON"]),
+                integers(swarms["EVENTS"]).astype(np.float32), floats(swarms["EXPECTED"]),
+            ]),
+            hovertemplate=(
+                "Swarm at %{customdata[0]:.2f}°N, %{customdata[1]:.2f}°E<br>"
+                "%{customdata[2]} events, %{customdata[3]:.2f} expected per window<extra></extra>"
+            ),
+        ))
+    fig.update_layout(
+        title="Rolling Seismicity Rate",
+        xaxis_title="Time",
+        yaxis_title="Events in window",
+        yaxis2=dict(title="Energy (J)", type="log", overlaying="y", side="right", showgrid=False),
+        legend=dict(orientation="h", y=-0.2),
+        height=500,
+    )
+    return fig
+
+# Default widget values of the page
+def warm_up(catalog):
+    level, window, probability = LEVELS.index(CELL_SIZES[1]), WINDOWS["1 Day"], PROBABILITIES["1 in a million"]
+    build_figure(catalog, catalog.digest, level, window, None, None, probability, None)
+
+def run():
+    st.title("Seismicity Rate & Swarms")
+    with span("load"):
+        catalog = load_catalog()
+
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        window = st.selectbox("Rolling Window", list(WINDOWS), index=2)
+    with col2:
+        size = st.selectbox("Cell Size (degrees)", CELL_SIZES, index=1)
+    with col3:
+        chance = st.selectbox("Swarm Significance", list(PROBABILITIES), index=1)
+    level, window, probability = LEVELS.index(size), WINDOWS[window], PROBABILITIES[chance]
+
+    region, declustering = selection_region(), selection_declustering()
+    if region is not None:
+        st.caption(f"Showing events {describe(region)}")
+    if declustering is not None:
+        st.caption(f"Mainshocks only ({declustering} windows)")
+
+    with span("aggregate"):
+        swarms = find_swarms(catalog, catalog.digest, level, window, declustering, region, probability)
+
+    # Whole selection, or one cell that had a swarm
+    cells = swarms[["LAT", "LON"]].drop_duplicates()
+    options = [None] + list(zip(cells["LAT"].tolist(), cells["LON"].tolist()))
+    focus = st.selectbox(
+        "Series Of",
+        options,
+        format_func=lambda cell: "All Events" if cell is None else f"Cell at {cell[0]:.2f}°N, {cell[1]:.2f}°E",
+    )
+
+    with span("figure"):
+        fig = build_figure(catalog, catalog.digest, level, window, declustering, region, probability, focus)
+
+    with span("render", payload=fig.to_json):
+        st.plotly_chart(fig, use_container_width=True)
+
+    st.subheader(f"Detected Swarms ({len(swarms):,})")
+    if swarms.empty:
+        st.info("No cell had a burst of events this unlikely at its long-term rate.")
+    else:
+        st.dataframe(swarms.drop(columns="ROW"), hide_index=True)
+
+    with st.expander("Details & Interpretation"):
+        st.markdown("""
+            Every event is counted together with the earlier events of its grid cell inside the rolling window, and the energy and
+            seismic moment they released are summed. A cell's long-term rate gives the number of events a window would hold by chance;
+            a window holding at least five events with a Poisson probability below the chosen significance is flagged, and flagged
+            windows of one cell less than a window apart are reported as one swarm. Swarms are bursts of many comparable events without
+            a clear mainshock, often linked to fluid movement, volcanic or induced activity; aftershock sequences are flagged as well
+            unless the sidebar keeps mainshocks only.
+                    """)
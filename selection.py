@@ -0,0 +1,64 @@
+import threading
+
+import numpy as np
+from streamlit import runtime
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+
+class Selection:
+    # What a browser session keeps in st.session_state: the filters it applied
+    # and the matching rows of the shared catalog, stored as an int32 index
+    # array or a packed bitmap, whichever is smaller. Rows are materialised only
+    # when a page renders.
+    def __init__(self, catalog, filters, rows):
+        self.path = catalog.path
+        self.version = catalog.version
+        self.digest = catalog.digest
+        self.filters = filters
+        self.size = len(catalog)
+        self.count = len(rows)
+
+        if (self.size + 7) // 8 < self.count * 4:
+            mask = np.zeros(self.size, dtype=bool)
+            mask[rows] = True
+            self._bits, self._index = np.packbits(mask), None
+        else:
+            self._bits, self._index = None, np.asarray(rows, dtype=np.int32)
+
+    @property
+    def nbytes(self):
+        return (self._bits if self._index is None else self._index).nbytes
+
+    @property
+    def encoding(self):
+        return "bitmap" if self._index is None else "index"
+
+    def rows(self):
+        if self._index is None:
+            return np.flatnonzero(np.unpackbits(self._bits, count=self.size))
+        return self._index
+
+    def materialise(self, catalog):
+        return catalog.take(self.rows())
+
+
+# Selection footprint of every live session, for the memory report
+_footprints = {}
+_lock = threading.Lock()
+
+
+def track(selection):
+    ctx = get_script_run_ctx()
+    if ctx is None:
+        return
+    with _lock:
+        _footprints[ctx.session_id] = selection.nbytes
+
+
+def footprints():
+    with _lock:
+        if runtime.exists():
+            instance = runtime.get_instance()
+            for session_id in [s for s in _footprints if not instance.is_active_session(s)]:
+                del _footprints[session_id]
+        return dict(_footprints)
@@ -1,53 +1,144 @@
+import numpy as np
 import streamlit as st
-import pandas as pd
+from decluster import WINDOWS
+from filters import filter_index, select
+from selection import Selection, track, footprints
+from spatial import PRESETS, describe, spatial_index
 
 # Sidebar filtering
-def sidebar(data):
+def sidebar(catalog):
+    index = filter_index(catalog)
+
     if "filters_applied" not in st.session_state:
         st.session_state.filters_applied = False
 
-    if "filtered_data" not in st.session_state:
-        st.session_state.filtered_data = data
+    # Sessions keep only a compact selection over the shared catalog; one made
+    # against an older catalog version, or another catalog file the page
+    # switched from, is re-resolved from its filters
+    selection = st.session_state.get("selection")
+    if selection is None or selection.version != catalog.version:
+        filters = selection.filters if selection is not None else ()
+        st.session_state.selection = Selection(catalog, filters, select(catalog, *filters))
+        if selection is not None and selection.path == catalog.path:
+            st.toast(f"Earthquake catalog updated: {len(catalog):,} events")
 
     st.sidebar.title("Filter Earthquake Data")
 
-    original_len = len(data)
-    data = data[(data['MAG'] > 0) & (data['DEPTH'] > 0)]
-    cleaned_len = len(data)
-
-    if cleaned_len < original_len:
-        st.sidebar.info(f"{original_len - cleaned_len} anomalous records with negative magnitude or depth were removed.")
+    removed = len(catalog) - len(index)
+    if removed:
+        st.sidebar.info(f"{removed} anomalous records with negative magnitude or depth were removed.")
 
     # Magnitude filter slider
     min_mag = st.sidebar.slider(
         "Minimum Magnitude",
-        min_value=float(data['MAG'].min()),
-        max_value=float(data['MAG'].max()),
+        min_value=index.mag_min,
+        max_value=index.mag_max,
         value=4.0
     )
-    
+
     # Year filter
-    years = data['DATE'].dt.year.unique()
-    start_year = st.sidebar.selectbox("Start Year", options=sorted(years), index=0)
-    end_year = st.sidebar.selectbox("End Year", options=sorted(years), index=len(years)-1)
+    years = index.years.tolist()
+    start_year = st.sidebar.selectbox("Start Year", options=years, index=0)
+    end_year = st.sidebar.selectbox("End Year", options=years, index=len(years)-1)
+
+    # Region filter
+    region = region_input(catalog)
+
+    # Aftershock filter
+    mainshocks = st.sidebar.checkbox("Mainshocks Only", help="Drop aftershocks identified by window declustering")
+    method = st.sidebar.selectbox("Aftershock Windows", list(WINDOWS)) if mainshocks else None
 
     # Apply filters button
     def apply_filters():
-        filtered_data = data[
-            (data['MAG'] >= min_mag) &
-            (data['DATE'].dt.year >= start_year) &  
-            (data['DATE'].dt.year <= end_year)
-        ]
-        st.session_state.filtered_data = filtered_data
+        filters = (min_mag, start_year, end_year, None, region, method)
+        # Unused trailing filters are left out, keeping the plain filters' cache keys
+        while filters[-1] is None:
+            filters = filters[:-1]
+        st.session_state.selection = Selection(catalog, filters, select(catalog, *filters))
         st.session_state.filters_applied = True
 
     # Clear filters button
     def clear_filters():
-        st.session_state.filtered_data = data
+        st.session_state.selection = Selection(catalog, (), select(catalog))
         st.session_state.filters_applied = False
 
     # Sidebar buttons for apply and clear filters
     apply_button = st.sidebar.button("Apply Filters", on_click=apply_filters)
     clear_button = st.sidebar.button("Clear Filters", on_click=clear_filters)
 
-    return st.session_state.filtered_data
+    selection = st.session_state.selection
+    if selection_region() is not None:
+        st.sidebar.caption(f"Showing events {describe(selection_region())}")
+    if selection_declustering() is not None:
+        st.sidebar.caption(f"Mainshocks only ({selection_declustering()} windows)")
+    track(selection)
+    memory_report(catalog, selection)
+
+    return selection.materialise(catalog)
+
+# Bounding box or radius around a point, as a hashable region tuple or None
+def region_input(catalog):
+    with st.sidebar.expander("Region"):
+        mode = st.radio("Region", ["Everywhere", "Preset", "Bounding Box", "Radius"], label_visibility="collapsed")
+        if mode == "Preset":
+            return PRESETS[st.selectbox("Preset", list(PRESETS))]
+        if mode == "Bounding Box":
+            south, west, north, east = extent(catalog)
+            col1, col2 = st.columns(2)
+            south = col1.number_input("South", -90.0, 90.0, south)
+            north = col2.number_input("North", -90.0, 90.0, north)
+            west = col1.number_input("West", -180.0, 180.0, west)
+            east = col2.number_input("East", -180.0, 180.0, east)
+            return ("bbox", min(south, north), min(west, east), max(south, north), max(west, east))
+        if mode == "Radius":
+            _, lat, lon, km = PRESETS["Vrancea zone"]
+            lat = st.number_input("Latitude", -90.0, 90.0, lat)
+            lon = st.number_input("Longitude", -180.0, 180.0, lon)
+            km = st.number_input("Radius (km)", 1.0, 5000.0, km, step=5.0)
+            return ("radius", lat, lon, km)
+    return None
+
+# Rounded extent of the located events, the default bounding box
+@st.cache_data(show_spinner=False)
+def _extent(_catalog, version):
+    index = spatial_index(_catalog)
+    lat, lon = index.lat[index.rows], index.lon[index.rows]
+    if not len(lat):
+        return -90.0, -180.0, 90.0, 180.0
+    return (float(np.floor(lat.min())), float(np.floor(lon.min())),
+            float(np.ceil(lat.max())), float(np.ceil(lon.max())))
+
+def extent(catalog):
+    return _extent(catalog, catalog.version)
+
+# Region of the current session's selection, for pages without the sidebar
+def selection_region():
+    selection = st.session_state.get("selection")
+    if selection is None or len(selection.filters) < 5:
+        return None
+    return selection.filters[4]
+
+# Aftershock windows of the current session's "Mainshocks Only" filter, or None
+def selection_declustering():
+    selection = st.session_state.get("selection")
+    if selection is None or len(selection.filters) < 6:
+        return None
+    return selection.filters[5]
+
+# Shared catalog vs per-session memory
+def memory_report(catalog, selection):
+    sessions = footprints()
+    shared = catalog.nbytes
+
+    with st.sidebar.expander("Memory Report"):
+        st.write(f"**Shared catalog:** {shared / 2**20:.1f} MB memory-mapped ({len(catalog):,} events)")
+        st.write(f"**This session:** {selection.nbytes / 2**10:.1f} KB "
+                 f"({selection.count:,} events as {selection.encoding})")
+        st.write(f"**All sessions:** {sum(sessions.values()) / 2**10:.1f} KB "
+                 f"across {len(sessions)} active session(s)")
+
+# Cache key for anything derived from the current session's filtered data;
+# content-based, so it stays valid across restarts for the disk cache
+def selection_key():
+    selection = st.session_state.selection
+    return (selection.digest, selection.filters)
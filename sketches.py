@@ -0,0 +1,344 @@
+import argparse
+import copy
+import functools
+import json
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+from streamlit import config
+
+import persist
+from catalog import CSV_PATH, read_catalog, read_csv_blocks, split_csv
+from cube import MAG_STEP, TOP_EVENTS
+from decluster import declustered
+
+# Out-of-core statistics: the summary the statistics page shows, computed
+# from a stream of column chunks with sketches whose partial results merge,
+# so chunks can be summarised in any order and by any number of processes
+# with memory bounded by the sketch sizes rather than the catalog.
+#
+#   python sketches.py --workers 8                  over the binary catalog
+#   python sketches.py --csv big.csv --workers 8    straight from a CSV file
+CHUNK_ROWS = 2**20
+
+# Compactor size of the quantile sketch; the rank error of a quantile is
+# about 1.7 / KLL_K of the number of values
+KLL_K = 256
+
+NAT = np.iinfo(np.int64).min
+
+
+class Moments:
+    # Count, mean, sum of squared deviations, minimum and maximum: Welford's
+    # running moments, with Chan's formula to add a chunk or another sketch
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        chunk = Moments()
+        chunk.n = len(values)
+        if chunk.n:
+            chunk.mean = float(values.mean())
+            chunk.m2 = float(((values - chunk.mean) ** 2).sum())
+            chunk.min, chunk.max = float(values.min()), float(values.max())
+        return self.merge(chunk)
+
+    def merge(self, other):
+        n = self.n + other.n
+        if other.n:
+            delta = other.mean - self.mean
+            self.mean += delta * other.n / n
+            self.m2 += other.m2 + delta ** 2 * self.n * other.n / n
+            self.min, self.max = min(self.min, other.min), max(self.max, other.max)
+        self.n = n
+        return self
+
+    @property
+    def std(self):
+        return np.sqrt(self.m2 / (self.n - 1)) if self.n > 1 else np.nan
+
+
+class KLL:
+    # Quantile sketch of Karnin, Lang & Liberty (2016). Level h holds values
+    # standing for 2**h each; a level over its capacity is sorted and every
+    # other value, from a random start, moves up a level. Capacities shrink
+    # geometrically below the top, so the sketch keeps O(k) values in all.
+    def __init__(self, k=KLL_K, seed=None):
+        self.k = k
+        self.n = 0
+        self.levels = [np.empty(0)]
+        self._rng = np.random.default_rng(seed)
+
+    def _capacity(self, level):
+        return max(int(np.ceil(self.k * (2 / 3) ** (len(self.levels) - level - 1))), 2)
+
+    def _compress(self):
+        while True:
+            full = [h for h, values in enumerate(self.levels) if len(values) > self._capacity(h)]
+            if not full:
+                return
+            h = full[0]
+            if h + 1 == len(self.levels):
+                self.levels.append(np.empty(0))
+            values = np.sort(self.levels[h])
+            # An odd value out stays, so the total weight is kept exactly
+            odd = len(values) % 2
+            self.levels[h] = values[:odd]
+            self.levels[h + 1] = np.concatenate([self.levels[h + 1], values[odd + self._rng.integers(2)::2]])
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        self.n += len(values)
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self._compress()
+        return self
+
+    def merge(self, other):
+        for h, values in enumerate(other.levels):
+            if h == len(self.levels):
+                self.levels.append(np.empty(0))
+            self.levels[h] = np.concatenate([self.levels[h], values])
+        self.n += other.n
+        self._compress()
+        return self
+
+    def quantile(self, q):
+        if not self.n:
+            return np.nan
+        values = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(level), 2 ** h) for h, level in enumerate(self.levels)])
+        order = np.argsort(values, kind="stable")
+        rank = np.cumsum(weights[order])
+        return float(values[order][min(np.searchsorted(rank, q * self.n), len(values) - 1)])
+
+
+class Histogram:
+    # Exact counts (and sums of a weight) over integer codes, stored densely
+    # from the smallest code seen
+    def __init__(self):
+        self.origin = 0
+        self.counts = np.zeros(0, dtype=np.int64)
+        self.sums = np.zeros(0)
+
+    def _cover(self, lo, hi):
+        if not len(self.counts):
+            self.origin = lo
+        before = max(self.origin - lo, 0)
+        after = max(hi - (self.origin + len(self.counts)) + 1, 0)
+        if before or after:
+            self.counts = np.pad(self.counts, (before, after))
+            self.sums = np.pad(self.sums, (before, after))
+            self.origin -= before
+
+    def update(self, codes, weights=None):
+        if len(codes):
+            self._cover(int(codes.min()), int(codes.max()))
+            self.counts += np.bincount(codes - self.origin, minlength=len(self.counts))
+            if weights is not None:
+                self.sums += np.bincount(codes - self.origin, weights=weights, minlength=len(self.sums))
+        return self
+
+    def merge(self, other):
+        if len(other.counts):
+            self._cover(other.origin, other.origin + len(other.counts) - 1)
+            at = other.origin - self.origin
+            self.counts[at:at + len(other.counts)] += other.counts
+            self.sums[at:at + len(other.sums)] += other.sums
+        return self
+
+    def codes(self):
+        return self.origin + np.arange(len(self.counts))
+
+
+class StreamingSummary:
+    # What the statistics page reads from the cube, from mergeable sketches:
+    # moments of magnitude and depth, a quantile sketch for the median
+    # magnitude, exact magnitude and (year, month, weekday) histograms and the
+    # strongest events. Answers the same calls as the cube.
+    def __init__(self, declustering=None):
+        self.declustering = declustering
+        self.mag = Moments()
+        self.depth = Moments()
+        self.quantiles = KLL()
+        self.magnitudes = Histogram()
+        self.calendar = Histogram()
+        self.top = {"EPOCH": np.empty(0, dtype=np.int64), "LAT": np.empty(0), "LON": np.empty(0), "MAG": np.empty(0)}
+
+    def update(self, columns, keep=None):
+        # Adds a chunk of catalog columns, cleaned as the statistics page
+        # always has; keep optionally masks the chunk's rows further
+        epoch, mag, depth = columns["EPOCH"], columns["MAG"], columns["DEPTH"]
+        valid = (epoch != NAT) & (mag > 0) & (depth > 0)
+        if keep is not None:
+            valid &= keep
+        epoch = epoch[valid]
+        mag, depth = mag[valid].astype(np.float64), depth[valid].astype(np.float64)
+
+        self.mag.update(mag)
+        self.depth.update(depth)
+        self.quantiles.update(mag)
+        self.magnitudes.update(np.rint(mag / MAG_STEP).astype(np.int64))
+
+        datetime = epoch.view("datetime64[ns]")
+        days = datetime.astype("datetime64[D]").astype(np.int64)
+        # 1970-01-01 was a Thursday; 0 is Monday as in pandas
+        self.calendar.update(datetime.astype("datetime64[M]").astype(np.int64) * 7 + (days + 3) % 7, mag)
+
+        top = {"EPOCH": epoch, "LAT": columns["LAT"][valid], "LON": columns["LON"][valid], "MAG": mag}
+        self._keep_top(top)
+        return self
+
+    def _keep_top(self, other):
+        # Strongest events, earlier first on ties as in the cube
+        merged = {name: np.concatenate([self.top[name], other[name]]) for name in self.top}
+        order = np.lexsort((merged["EPOCH"], -merged["MAG"]))[:TOP_EVENTS]
+        self.top = {name: values[order] for name, values in merged.items()}
+
+    def merge(self, other):
+        self.mag.merge(other.mag)
+        self.depth.merge(other.depth)
+        self.quantiles.merge(other.quantiles)
+        self.magnitudes.merge(other.magnitudes)
+        self.calendar.merge(other.calendar)
+        self._keep_top(other.top)
+        return self
+
+    def extend(self, catalog, start):
+        # Catalog rows appended from start on, for Catalog.inherit
+        return copy.deepcopy(self).merge(summarise_catalog(catalog, self.declustering, start))
+
+    def _cells(self):
+        codes = self.calendar.codes()
+        present = self.calendar.counts > 0
+        months = codes[present] // 7
+        return pd.DataFrame({
+            "YEAR": months // 12 + 1970,
+            "MONTH": months % 12 + 1,
+            "WEEKDAY": codes[present] % 7,
+            "COUNT": self.calendar.counts[present],
+            "MAG_SUM": self.calendar.sums[present],
+        })
+
+    def years(self):
+        return sorted(self._cells()["YEAR"].unique().tolist())
+
+    def counts(self, *dims, **where):
+        cells = self._cells()
+        for dim, value in where.items():
+            cells = cells[cells[dim] == value]
+        return cells.groupby(list(dims))["COUNT"].sum()
+
+    def mean_magnitude(self, *dims):
+        table = self._cells().groupby(list(dims))[["MAG_SUM", "COUNT"]].sum()
+        return table["MAG_SUM"] / table["COUNT"]
+
+    def magnitude_histogram(self):
+        present = self.magnitudes.counts > 0
+        index = pd.Index((self.magnitudes.codes()[present] * MAG_STEP).round(1), name="MAG")
+        return pd.Series(self.magnitudes.counts[present], index=index, name="COUNT")
+
+    @property
+    def largest(self):
+        return pd.DataFrame({
+            "DATE": self.top["EPOCH"].view("datetime64[ns]").astype("datetime64[D]").astype("datetime64[ns]"),
+            "LAT": self.top["LAT"].astype(np.float64).round(4),
+            "LON": self.top["LON"].astype(np.float64).round(4),
+            "MAG": self.top["MAG"].round(1),
+        })
+
+    def summary(self):
+        histogram = self.magnitude_histogram()
+        n = self.mag.n
+        return {
+            "Total Earthquakes": int(n),
+            "Minimum Magnitude": self.mag.min,
+            "Maximum Magnitude": self.mag.max,
+            "Median Magnitude": self.quantiles.quantile(0.5),
+            "Mean Magnitude": self.mag.mean,
+            "Standard Deviation (Magnitude)": self.mag.std,
+            "Mode Magnitude": histogram.idxmax() if n else None,
+            "Average Depth (km)": self.depth.mean,
+            "Shallowest Earthquake (km)": self.depth.min,
+            "Deepest Earthquake (km)": self.depth.max,
+        }
+
+
+def column_chunks(columns, start=0, stop=None, size=CHUNK_ROWS):
+    # (first row, columns) of consecutive row ranges of in-memory or
+    # memory-mapped columns
+    stop = len(columns["EPOCH"]) if stop is None else stop
+    for first in range(start, stop, size):
+        yield first, {name: column[first:min(first + size, stop)] for name, column in columns.items()}
+
+
+def summarise_catalog(catalog, declustering=None, start=0, stop=None):
+    # Rows start..stop of a catalog, chunk by chunk from its memory-mapped columns
+    mainshock = declustered(catalog, declustering).mainshock if declustering is not None else None
+    summary = StreamingSummary(declustering)
+    for first, columns in column_chunks(catalog.columns, start, stop):
+        summary.update(columns, None if mainshock is None else mainshock[first:first + len(columns["EPOCH"])])
+    return summary
+
+
+def summarise_csv(path, start=None, stop=None):
+    # A byte range of whole lines of a catalog file, parsed block by block
+    summary = StreamingSummary()
+    for columns in read_csv_blocks(path, start, stop):
+        summary.update(columns)
+    return summary
+
+
+def _summarise_rows(path, declustering, start, stop):
+    return summarise_catalog(read_catalog(path), declustering, start, stop)
+
+
+def summarise_parallel(path=CSV_PATH, workers=None, csv=False, declustering=None):
+    # The catalog cut into one part per worker, summarised in parallel and
+    # merged. From the binary catalog (parsed once, here) or, with csv,
+    # straight from the file without loading it.
+    workers = workers or 1
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        if csv:
+            parts = [pool.submit(summarise_csv, path, start, stop) for start, stop in split_csv(path, workers)]
+        else:
+            size = len(read_catalog(path))
+            bounds = np.linspace(0, size, workers + 1).astype(np.int64).tolist()
+            parts = [pool.submit(_summarise_rows, path, declustering, start, stop) for start, stop in zip(bounds, bounds[1:])]
+        return functools.reduce(lambda total, part: total.merge(part.result()), parts, StreamingSummary(declustering))
+
+
+def streaming_summary(catalog, declustering=None):
+    # Per catalog version and on disk, as the statistics cube
+    return catalog.derived(("streaming_summary", declustering), lambda catalog: persist.get_or_build(
+        "streaming_summary", (catalog.digest, declustering),
+        lambda: summarise_catalog(catalog, declustering)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarise a catalog chunk by chunk with mergeable sketches.")
+    parser.add_argument("--catalog", default=CSV_PATH, help="catalog CSV file")
+    parser.add_argument("--csv", action="store_true", help="stream the CSV file itself instead of the binary catalog")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--mainshocks", help="aftershock windows whose mainshocks alone are summarised")
+    args = parser.parse_args()
+    if args.csv and args.mainshocks:
+        parser.error("--mainshocks needs the binary catalog, whose declustering it reads")
+
+    # Bare-mode cache warnings are expected here
+    config.set_option("logger.level", "error")
+    st.logger.set_log_level("error")
+
+    summary = summarise_parallel(args.catalog, args.workers, args.csv, args.mainshocks)
+    values = {stat: value.item() if isinstance(value, np.generic) else value for stat, value in summary.summary().items()}
+    print(json.dumps(values, indent=2))
+
+
+if __name__ == "__main__":
+    main()
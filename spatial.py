@@ -0,0 +1,104 @@
+import copy
+
+import numpy as np
+
+# Grid cell size in degrees; a query visits one run of cells per latitude band
+CELL = 0.25
+COLUMNS = int(np.ceil(360 / CELL))
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = np.pi * EARTH_RADIUS_KM / 180
+
+# Named regions offered in the sidebar: ("radius", lat, lon, km) or
+# ("bbox", south, west, north, east)
+PRESETS = {
+    "Vrancea zone": ("radius", 45.7, 26.6, 75.0),
+    "Romania": ("bbox", 43.6, 20.2, 48.3, 29.8),
+}
+
+
+def _codes(lat, lon):
+    return np.floor((lat + 90) / CELL).astype(np.int64) * COLUMNS + np.floor((lon + 180) / CELL).astype(np.int64)
+
+
+def haversine(lat, lon, lat0, lon0):
+    # Great-circle distance in km
+    lat, lon, lat0, lon0 = map(np.radians, (lat, lon, lat0, lon0))
+    a = np.sin((lat - lat0) / 2) ** 2 + np.cos(lat) * np.cos(lat0) * np.sin((lon - lon0) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def bounds(region):
+    # Bounding box (south, west, north, east) of a region
+    if region[0] == "bbox":
+        return region[1:]
+    _, lat, lon, km = region
+    dlat = km / KM_PER_DEGREE
+    dlon = km / (KM_PER_DEGREE * max(np.cos(np.radians(lat)), 1e-6))
+    return max(lat - dlat, -90.0), max(lon - dlon, -180.0), min(lat + dlat, 90.0), min(lon + dlon, 180.0)
+
+
+def describe(region):
+    if region[0] == "bbox":
+        south, west, north, east = region[1:]
+        return f"{south:g}–{north:g}°N, {west:g}–{east:g}°E"
+    _, lat, lon, km = region
+    return f"within {km:g} km of {lat:g}°N, {lon:g}°E"
+
+
+class SpatialIndex:
+    # Located events sorted by grid cell. Cells along a latitude band have
+    # consecutive codes, so a region is a binary search per band over the
+    # cells it touches, followed by an exact test of those candidates only.
+    def __init__(self, catalog):
+        lat, lon = catalog.columns["LAT"], catalog.columns["LON"]
+        located = np.flatnonzero(~np.isnan(lat) & ~np.isnan(lon))
+        codes = _codes(lat[located].astype(np.float64), lon[located].astype(np.float64))
+        order = np.argsort(codes, kind="stable")
+        self.codes = codes[order]
+        self.rows = located[order]
+        self.lat, self.lon = lat, lon
+
+    def __len__(self):
+        return len(self.rows)
+
+    def extend(self, catalog, start):
+        # Catalog rows appended from start on, for Catalog.inherit
+        lat, lon = catalog.columns["LAT"], catalog.columns["LON"]
+        located = start + np.flatnonzero(~np.isnan(lat[start:]) & ~np.isnan(lon[start:]))
+        codes = _codes(lat[located].astype(np.float64), lon[located].astype(np.float64))
+        order = np.argsort(codes, kind="stable")
+        at = np.searchsorted(self.codes, codes[order], side="right")
+
+        index = copy.copy(self)
+        index.codes = np.insert(self.codes, at, codes[order])
+        index.rows = np.insert(self.rows, at, located[order])
+        index.lat, index.lon = lat, lon
+        return index
+
+    def candidates(self, south, west, north, east):
+        # Rows in the grid cells overlapping the box
+        first_band, last_band = (int(np.floor((v + 90) / CELL)) for v in (south, north))
+        first_cell, last_cell = (int(np.floor((v + 180) / CELL)) for v in (west, east))
+        bands = np.arange(first_band, last_band + 1) * COLUMNS
+        lo = np.searchsorted(self.codes, bands + first_cell, side="left")
+        hi = np.searchsorted(self.codes, bands + last_cell, side="right")
+        parts = [self.rows[a:b] for a, b in zip(lo, hi) if b > a]
+        return np.concatenate(parts) if parts else np.empty(0, dtype=np.int64)
+
+    def within(self, region):
+        # Sorted catalog positions of the located events inside the region
+        south, west, north, east = bounds(region)
+        rows = self.candidates(south, west, north, east)
+        lat = self.lat[rows].astype(np.float64)
+        lon = self.lon[rows].astype(np.float64)
+        if region[0] == "bbox":
+            inside = (lat >= south) & (lat <= north) & (lon >= west) & (lon <= east)
+        else:
+            _, lat0, lon0, km = region
+            inside = haversine(lat, lon, lat0, lon0) <= km
+        return np.sort(rows[inside])
+
+
+def spatial_index(catalog):
+    return catalog.derived("spatial_index", SpatialIndex)
@@ -1,60 +1,94 @@
+import numpy as np
 import streamlit as st
-import pandas as pd
-import pydeck as pdk
-from sidebar import sidebar  
+from aggregate import aggregate
+from catalog import load_catalog
+from filters import filter_index
+from perf import span
+from persist import persistent
+from sidebar import sidebar, selection_key
+from transport import compact_deck, magnitude_colors, records
 
-@st.cache_data
-def load_data():
-    data = pd.read_csv("dataOUT/earthquakes.csv")
-    data = data.dropna(subset=["LAT", "LON", "MAG"])
-    data['DATE'] = pd.to_datetime(data['DATE'], errors='coerce')
-    return data
+# Columns are drawn per grid cell rather than per event; cells are never
+# finer than 0.1 degrees, roughly the footprint of the original 5 km columns
+MAX_COLUMNS = 5000
+MIN_CELL_SIZE = 0.1
 
-def run():
-    data = load_data()
+@st.cache_data(max_entries=8, show_spinner=False)
+@persistent("spikeMap.cells")
+def build_cells(_catalog, _rows, key):
+    cells, size = aggregate(_catalog, _rows, MAX_COLUMNS, MIN_CELL_SIZE)
+    cells["MAG_MAX"] = cells["MAG_MAX"].round(1)
+    cells["MAG_MEAN"] = cells["MAG_MEAN"].round(2)
+    return cells, size
 
-    filtered_data = sidebar(data)
-    if filtered_data.empty:
-        st.sidebar.warning("No data available for the selected filters.")
-        return
-    
-    st.title("3D Spike Map")
+def build_deck(cells, size):
+    # Heavy imports are deferred until a page needs them (see warmup.py)
+    import pydeck as pdk
+
+    # Only the columns the layer and tooltip use, with the colour gradient
+    # (strongest event per cell) and elevation computed up front
+    data = records({
+        "POSITION": np.column_stack([cells["LON"], cells["LAT"]]),
+        "ELEVATION": cells["MAG_MAX"].to_numpy() * 50000,
+        "COLOR": magnitude_colors(cells["MAG_MAX"].to_numpy()),
+        "COUNT": cells["COUNT"].to_numpy(),
+        "MAG_MAX": cells["MAG_MAX"].to_numpy(),
+        "MAG_MEAN": cells["MAG_MEAN"].to_numpy(),
+    })
 
-    # Set up the 3D ColumnLayer with color gradient based on magnitude
+    # Set up the 3D ColumnLayer
     layer = pdk.Layer(
         "ColumnLayer",
-        data=filtered_data,
-        get_position='[LON, LAT]',
-        get_elevation="MAG * 50000", 
+        data=data,
+        get_position="POSITION",
+        get_elevation="ELEVATION",
         elevation_scale=1,  
-        radius=5000,  
-        get_fill_color="""
-            [
-                 MAG * 25.5,
-                 255 - MAG * 25.5,         
-                 MAG * 25.5,                     
-                 200                 
-            ]
-            """,
+        radius=size * 111_000 / 2,  
+        get_fill_color="COLOR",
         pickable=True,
         auto_highlight=True,
     )
 
     # Set up the view for the map with orientation and tilt
     view_state = pdk.ViewState(
-        longitude=filtered_data["LON"].mean(),  
-        latitude=filtered_data["LAT"].mean(),   
+        longitude=np.average(cells["LON"], weights=cells["COUNT"]),  
+        latitude=np.average(cells["LAT"], weights=cells["COUNT"]),   
         zoom=3,  
         pitch=50,  
         bearing=30,  
     )
 
     # Create the PyDeck Deck map with the 3D columns
-    deck = pdk.Deck(
+    return compact_deck(
         layers=[layer],
         initial_view_state=view_state,
-        tooltip={"text": "Magnitude: {MAG}"},
+        tooltip={"text": "Earthquakes: {COUNT}\nMax magnitude: {MAG_MAX}\nMean magnitude: {MAG_MEAN}"},
     )
 
-    st.pydeck_chart(deck)
+# Default view of a new session: every valid event, no filters applied
+def warm_up(catalog):
+    cells, size = build_cells(catalog, filter_index(catalog).query(), (catalog.digest, ()))
+    build_deck(cells, size)
+
+def run():
+    with span("load"):
+        catalog = load_catalog()
+
+    with span("filter"):
+        filtered_data = sidebar(catalog)
+    if filtered_data.empty:
+        st.sidebar.warning("No data available for the selected filters.")
+        return
+    
+    st.title("3D Spike Map")
+
+    with span("aggregate"):
+        cells, size = build_cells(catalog, filtered_data.index.to_numpy(), selection_key())
+
+    with span("figure"):
+        deck = build_deck(cells, size)
+
+    with span("render", payload=deck.to_json):
+        st.pydeck_chart(deck)
+    st.caption(f"{len(filtered_data):,} earthquakes aggregated into {len(cells):,} cells of {size}°.")
 
@@ -0,0 +1,23 @@
+import re
+import shutil
+import subprocess
+
+import numpy as np
+import pytest
+
+from heatMap import build_map
+
+
+@pytest.mark.skipif(shutil.which("node") is None, reason="needs node to parse JavaScript")
+def test_map_script_parses(tmp_path):
+    heat = np.array([[45.7, 26.6, 12.5], [45.2, 27.1, 8.0]])
+    markers = np.array([[45.7, 26.6, 4.2, 1262304000.0], [45.2, 27.1, 3.1, 1293840000.0]])
+    html = build_map(heat, markers).get_root().render()
+
+    scripts = re.findall(r"<script>(.*?)</script>", html, re.S)
+    assert any("markerClusterGroup" in script for script in scripts)
+    for i, script in enumerate(scripts):
+        path = tmp_path / f"script-{i}.js"
+        path.write_text(script)
+        result = subprocess.run(["node", "--check", str(path)], capture_output=True, text=True)
+        assert result.returncode == 0, result.stderr
@@ -0,0 +1,38 @@
+import itertools
+
+import numpy as np
+import pytest
+
+from catalog import Catalog
+from filters import FilterIndex
+from partitions import GRAINS, Partitions, partition_table
+
+NAT = np.iinfo(np.int64).min
+
+
+@pytest.fixture(scope="module")
+def catalog():
+    # Chronological, undated rows first, with the anomalies the sidebar drops
+    rng = np.random.default_rng(7)
+    n = 20_000
+    epoch = np.sort(rng.integers(np.datetime64("1990-01-01", "ns").view(np.int64),
+                                 np.datetime64("2020-01-01", "ns").view(np.int64), n))
+    epoch[:20] = NAT
+    mag = rng.uniform(-0.5, 7.0, n).astype(np.float32)
+    depth = rng.uniform(-5.0, 200.0, n).astype(np.float32)
+    lat = rng.uniform(43.0, 49.0, n).astype(np.float32)
+    mag[rng.integers(0, n, 50)] = np.nan
+    lat[rng.integers(0, n, 50)] = np.nan
+    columns = {"EPOCH": epoch, "LAT": lat, "LON": rng.uniform(20.0, 30.0, n).astype(np.float32), "DEPTH": depth, "MAG": mag}
+    return Catalog(columns, "test")
+
+
+@pytest.mark.parametrize("grain", list(GRAINS))
+def test_scan_matches_filter_index(catalog, grain):
+    index = FilterIndex(catalog)
+    parts = Partitions(partition_table(catalog.columns, grain), grain)
+    filters = itertools.product([None, 2.0, 6.5, 8.0], [None, 1990, 2005], [None, 2005, 2019], [None, (0.0, 10.0), (150.0, 300.0)])
+    for min_mag, start_year, end_year, depth_range in filters:
+        expected = index.query(min_mag, start_year, end_year, depth_range)
+        found = parts.scan(catalog.columns, min_mag, start_year, end_year, depth_range)
+        assert np.array_equal(found, expected), (min_mag, start_year, end_year, depth_range)
@@ -0,0 +1,30 @@
+import numpy as np
+import pandas as pd
+
+from timestamps import NAT, parse_dates, parse_epoch, parse_times
+
+
+def test_fraction_to_nanoseconds():
+    times = ["12:00:00.123456789", "12:00:00.2", "12:00:00.05", "12:00:00"]
+    expected = [43200 * 10**9 + 123456789, 43200 * 10**9 + 200000000, 43200 * 10**9 + 50000000, 43200 * 10**9]
+    assert parse_times(times).tolist() == expected
+
+
+def test_out_of_range_fields_as_pandas():
+    times = ["99:00:00", "24:00:00", "23:59:60", "12:61:00", "1:02:03", "", None]
+    expected = pd.to_timedelta(pd.Series(times, dtype=object), errors="coerce").fillna(pd.Timedelta(0))
+    assert parse_times(times).tolist() == expected.to_numpy("timedelta64[ns]").view(np.int64).tolist()
+
+
+def test_dates():
+    dates = ["2000-01-02", "2000-02-30", "2001-13-01", "", None, "2004-02-29"]
+    epoch = parse_dates(dates)
+    assert epoch[0] == np.datetime64("2000-01-02", "ns").view(np.int64)
+    assert epoch[5] == np.datetime64("2004-02-29", "ns").view(np.int64)
+    assert (epoch[1:5] == NAT).all()
+
+
+def test_epoch():
+    epoch = parse_epoch(["2000-01-02", None], ["11:07:46.20", "11:07:46"])
+    assert epoch[0] == np.datetime64("2000-01-02T11:07:46.200", "ns").view(np.int64)
+    assert epoch[1] == NAT
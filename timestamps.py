@@ -0,0 +1,101 @@
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+# DATE and TIME as the catalog writes them: "2000-01-02" and "11:07:46" or
+# "11:07:46.20" (any number of fractional digits up to nanoseconds). Fields
+# in that shape are decoded from their bytes in bulk; anything else falls
+# back to pandas' parsers, row by row only for those fields.
+NAT = np.iinfo(np.int64).min
+NS_PER_S = 10**9
+
+
+def _bytes(values):
+    # Byte matrix of the strings, zero-padded to the longest (missing values
+    # are empty), and their lengths. pyarrow comes with Streamlit; its string
+    # buffers are gathered into the matrix without per-row Python work.
+    strings = pa.array(values, type=pa.string(), from_pandas=True)
+    offsets = np.frombuffer(strings.buffers()[1], dtype=np.int32)[strings.offset:strings.offset + len(strings) + 1]
+    data = np.frombuffer(strings.buffers()[2], dtype=np.uint8) if strings.buffers()[2] else np.zeros(1, np.uint8)
+    length = np.diff(offsets)
+    width = max(int(length.max()) if len(length) else 0, 1)
+    column = np.arange(width, dtype=np.int32)
+    at = np.minimum(offsets[:-1, None] + column, len(data) - 1)
+    return np.where(column < length[:, None], data[at], 0).astype(np.uint8), length
+
+
+def _digits(matrix, positions):
+    # Integer value of the digits at positions, and whether all were digits
+    value = np.zeros(len(matrix), dtype=np.int32)
+    ok = np.ones(len(matrix), dtype=bool)
+    for position in positions:
+        digit = matrix[:, position] - np.uint8(ord("0"))
+        ok &= digit <= 9
+        value = value * 10 + digit
+    return value.astype(np.int64), ok
+
+
+def _pad(matrix, width):
+    if matrix.shape[1] >= width:
+        return matrix
+    return np.pad(matrix, ((0, 0), (0, width - matrix.shape[1])))
+
+
+def parse_dates(values):
+    # Epoch nanoseconds at midnight, NAT where the date is missing or invalid
+    values = np.asarray(values, dtype=object)
+    matrix, length = _bytes(values)
+    matrix = _pad(matrix, 10)
+
+    year, ok_y = _digits(matrix, [0, 1, 2, 3])
+    month, ok_m = _digits(matrix, [5, 6])
+    day, ok_d = _digits(matrix, [8, 9])
+    fast = ok_y & ok_m & ok_d & (length == 10) & (matrix[:, 4] == ord("-")) & (matrix[:, 7] == ord("-"))
+    fast &= (month >= 1) & (month <= 12) & (day >= 1)
+
+    months = np.where(fast, (year - 1970) * 12 + month - 1, 0).astype("datetime64[M]")
+    first = months.astype("datetime64[D]").astype(np.int64)
+    fast &= day <= (months + 1).astype("datetime64[D]").astype(np.int64) - first
+
+    epoch = np.where(fast, (first + day - 1) * 86400 * NS_PER_S, NAT)
+    slow = ~fast & (length > 0)
+    if slow.any():
+        epoch[slow] = pd.to_datetime(values[slow], errors="coerce").to_numpy("datetime64[ns]").view(np.int64)
+    return epoch
+
+
+def parse_times(values):
+    # Nanoseconds since midnight, 0 where the time is missing or invalid
+    values = np.asarray(values, dtype=object)
+    matrix, length = _bytes(values)
+    matrix = _pad(matrix, 8)
+
+    hour, ok_h = _digits(matrix, [0, 1])
+    minute, ok_m = _digits(matrix, [3, 4])
+    second, ok_s = _digits(matrix, [6, 7])
+    fast = ok_h & ok_m & ok_s & (matrix[:, 2] == ord(":")) & (matrix[:, 5] == ord(":"))
+    fast &= (hour < 24) & (minute < 60) & (second < 60)
+    fast &= (length == 8) | ((length > 9) & (length <= 18) & (_pad(matrix, 9)[:, 8] == ord(".")))
+
+    # Fractional digits, right-padded with zeros to nanoseconds
+    fraction = np.zeros(len(values), dtype=np.int64)
+    for position in range(9, min(matrix.shape[1], 18)):
+        present = matrix[:, position] != 0
+        digit = matrix[:, position] - np.uint8(ord("0"))
+        fast &= (digit <= 9) | ~present
+        fraction += np.where(present, digit, 0).astype(np.int64) * 10 ** (17 - position)
+
+    nanos = np.where(fast, ((hour * 60 + minute) * 60 + second) * NS_PER_S + fraction, 0)
+    slow = ~fast & (length > 0)
+    if slow.any():
+        nanos[slow] = pd.to_timedelta(values[slow], errors="coerce").fillna(pd.Timedelta(0)).to_numpy("timedelta64[ns]").view(np.int64)
+    return nanos
+
+
+def parse_epoch(date, time=None):
+    # Epoch nanoseconds of DATE plus TIME, NAT where the date is unusable
+    epoch = parse_dates(date)
+    if time is not None:
+        dated = epoch != NAT
+        epoch[dated] += parse_times(time)[dated]
+    return epoch
@@ -0,0 +1,66 @@
+import functools
+import json
+
+import numpy as np
+
+# Compact encodings for what the pages send to the browser. Plotly (>= 6)
+# sends numpy arrays as base64 typed arrays, so values are narrowed to the
+# smallest dtype that holds them. Streamlit passes pydeck charts on as JSON
+# only, so there the same narrowing becomes pruned, rounded records with the
+# colours and elevations computed here rather than per row in the browser.
+
+# Coordinates to 4 decimals are within about 11 m, finer than the catalog
+COORDINATE_DECIMALS = 4
+
+
+def floats(values):
+    return np.ascontiguousarray(values, dtype=np.float32)
+
+
+def integers(values):
+    # Smallest unsigned dtype plotly.js has a typed array for
+    values = np.asarray(values)
+    top = int(values.max()) if len(values) else 0
+    for dtype in (np.uint8, np.uint16, np.uint32):
+        if top <= np.iinfo(dtype).max:
+            return values.astype(dtype)
+    return values.astype(np.float64)
+
+
+def magnitude_colors(mag, alpha=200):
+    # RGBA from green (weak) to magenta (M 10)
+    scaled = np.clip(np.asarray(mag, dtype=np.float32) * 25.5, 0, 255)
+    colors = np.empty((len(scaled), 4), dtype=np.uint8)
+    colors[:, 0] = colors[:, 2] = scaled
+    colors[:, 1] = 255 - scaled
+    colors[:, 3] = alpha
+    return colors
+
+
+def records(columns):
+    # Row records from {name: array}, for pydeck layers. Floats are rounded
+    # so they print short, 2-D arrays become per-row lists.
+    values = {}
+    for name, array in columns.items():
+        array = np.asarray(array)
+        if array.dtype.kind == "f":
+            array = array.astype(np.float64).round(COORDINATE_DECIMALS)
+        values[name] = array.tolist()
+    return [dict(zip(values, row)) for row in zip(*values.values())]
+
+
+@functools.cache
+def _compact_deck():
+    import pydeck as pdk
+    from pydeck.bindings.json_tools import default_serialize
+
+    class CompactDeck(pdk.Deck):
+        # st.pydeck_chart sends to_json() as it is, which pydeck indents
+        def to_json(self):
+            return json.dumps(self, sort_keys=True, default=default_serialize, separators=(",", ":"))
+
+    return CompactDeck
+
+
+def compact_deck(**kwargs):
+    return _compact_deck()(**kwargs)
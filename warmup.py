@@ -0,0 +1,58 @@
+import importlib
+import logging
+import os
+
+import streamlit as st
+
+import perf
+from catalog import WATCH_INTERVAL_S, background_thread, catalog_watcher, load_catalog
+
+# Pages whose default view is built ahead of the first visitor, cheapest first
+PAGES = ["descriptiveStat", "spikeMap", "heatMap", "animatedMap", "flowMap", "bValueMap", "seismicRate"]
+
+log = logging.getLogger(__name__)
+
+
+def enabled():
+    # EARTHQUAKE_WARM_UP=0 starts the app cold, e.g. to measure the difference
+    return os.environ.get("EARTHQUAKE_WARM_UP", "1") != "0"
+
+
+def warm_up(catalog=None):
+    # Parses the catalog and fills the same caches a page's first rerun reads,
+    # so a visitor arriving meanwhile waits on the work already in progress
+    # instead of starting it again
+    with perf.rerun("warm-up"):
+        with perf.span("load"):
+            if catalog is None:
+                catalog = load_catalog()
+        for page in PAGES:
+            with perf.span(page):
+                try:
+                    importlib.import_module(page).warm_up(catalog)
+                except Exception:
+                    # The page reports its own error when it is opened
+                    log.exception("Warm-up of %s failed", page)
+
+
+def _start_up():
+    warm_up()
+    if WATCH_INTERVAL_S <= 0:
+        return
+    # A changed catalog is warmed the same way before sessions switch to it
+    watcher = catalog_watcher()
+    if warm_up not in watcher.on_reload:
+        watcher.on_reload.append(warm_up)
+
+
+@st.cache_resource(show_spinner=False)
+def start():
+    # Once per process; the thread is a daemon so it never delays shutdown
+    if not enabled():
+        return None
+    return background_thread(_start_up, "earthquake-warm-up")
+
+
+if __name__ == "__main__":
+    # Deploy step: writes the binary catalog to disk ahead of the first start
+    warm_up()